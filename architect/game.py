@@ -48,14 +48,23 @@ JSON_Reader:
     their respective classes and encode all the information about the game.
 """
 
-from architect.ontology import Room, Action, Inventory, Item
-from architect.utils import Parser, JSON_Reader
-from collections import OrderedDict
-
+from architect.ontology import Room, Action, Inventory, Item, NameIndex
+from architect.ontology import LazyRoom, LazyItem
+from architect.utils import Parser, JSON_Reader, Registry, Overlay
+from architect.utils import Output_Buffer
+from architect.worldfile import pack, unpack
+from architect.instrument import Instruments
+from architect.graph import RoomGraph
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import logging
 import re
+import struct
+import time
 
-# Verbose option.
-V = True
+# Debugging output; see Game.trace for a single game's.
+log = logging.getLogger(__name__)
 
 class InvalidBranchError(Exception):
     pass
@@ -76,7 +85,29 @@ class Module():
         
 class Game():
     cardinals = {'w':0, 's':1, 'n':2, 'e':3}
+    # Movement words and what they stand for; Room exits are keyed by
+    # the cardinals' links index or, for any other direction, its name.
+    directions = {'w':'w', 's':'s', 'n':'n', 'e':'e',
+                  'west':'w', 'south':'s', 'north':'n', 'east':'e',
+                  'u':'up', 'up':'up', 'd':'down', 'down':'down',
+                  'in':'in', 'out':'out'}
+
+    # First words prompt_exe knows besides actions and directions, and the
+    # methods handling them; see _compileCommands.
+    system_commands = {'go': '_goCommand', 'undo': '_undoCommand',
+                       'look': '_lookCommand', 'l': '_lookCommand',
+                       'inv': '_invCommand', 'i': '_invCommand',
+                       'quit': '_quitCommand', 'q': '_quitCommand'}
+    # Words standing for other commands. A world's own aliases (meta
+    # "aliases") may replace any word; these never hide one it uses.
+    aliases = {'inventory': 'inv', 'get': 'take'}
+    # Shortest prefix of a command word that may stand for it.
+    prefix_min = 2
     special_actions = ['take'] ## Special actions are... weird.
+
+    # Stage timings (see instrument.py). Set on a Game to time its
+    # commands, or here to also time every game's Blueprint compilation.
+    instruments = None
     ##TODO: Figure out the role of special actions.
 
     ERROR = {
@@ -88,6 +119,11 @@ class Game():
         "act_using_rooms": "You can't do that with an entire room.",
         "act_already_holding": "You've already got one of those.",
         "act_taking_prop": "It doesn't seem like you could carry that.",
+        "act_too_heavy": "You can't carry any more.",
+        "undo_empty": "There's nothing to undo.",
+        "go_where": "Where do you want to go?",
+        "go_unknown": "You don't know how to get there.",
+        "go_here": "You're already there.",
         "room_no_room_found": "WARNING: Incorrect room in Blueprint."
         }
     ACT_MSGS = {
@@ -97,7 +133,23 @@ class Game():
         }
     GAME_MSGS = {
         "beginning": "Welcome to the demo!",
-        "quit": "Game closing."
+        "quit": "Game closing.",
+        "undo": "Undone."
+        }
+
+    # Operand kinds of each Blueprint command, used by _bpCompile to
+    # resolve arguments once at load instead of on every call.
+    BP_OPERANDS = {
+        'puts':           ('text',),
+        'link':           ('room', 'dir', 'room'),
+        'add':            ('item', 'container', 'bag'),
+        'remove':         ('item', 'container', 'bag'),
+        'move':           ('item', 'container', 'container'),
+        'changeItem':     ('item', 'attr', 'text'),
+        'changeRoom':     ('room', 'attr', 'text'),
+        'changeInv':      ('bag', 'attr', 'text'),
+        'addProperty':    ('item', 'text'),
+        'removeProperty': ('item', 'text'),
         }
 
     special_actions = {
@@ -113,18 +165,59 @@ class Game():
 #---------------------------- Initialization ---------------------------------
 
     def __init__(self, rdata, idata, adata, mdata):
-        self.rooms = {iden:Room(data) for iden, data in rdata.items()}
-        self.items = {iden:Item(data) for iden, data in idata.items()}
+        self.log = log
+
+        # Copy-on-write games (see Game.session) share another game's
+        # world through Overlays and only copy what they change.
+        self.is_cow = isinstance(rdata, Overlay)
+        self.base = None
+        # IDs of Items this copy-on-write game renamed.
+        self.renamed = set()
+        # State of each (is_room, id) before this game first changed it;
+        # copy-on-write games keep the base instead. See snapshot.
+        self.pristine = {}
+        # Inverse operations of the latest commands; see rollback.
+        self.journal = deque(maxlen = mdata.get('undoLimit', 64))
+        self._step = None
+
+        # Lazy games only build the Rooms and Items a session touches.
+        # It needs raw records; built objects are taken as they are.
+        self.is_lazy = mdata.get('isLazy', False) and not self.is_cow and \
+                   not isinstance(next(iter(rdata.values()), None), Room)
+
+        if self.is_cow:
+            self.rooms, self.items = rdata, idata
+        elif self.is_lazy:
+            self.rooms = Registry(rdata, lambda iden, data:
+                                  LazyRoom(iden, data, self._hydrateRoom))
+            self.items = Registry(idata, LazyItem)
+        else:
+            # Info dicts may hold built objects (JSON_Reader streaming).
+            B = lambda cls, data: data if isinstance(data, cls) else cls(data)
+            self.rooms = {iden:B(Room, data) for iden, data in rdata.items()}
+            self.items = {iden:B(Item, data) for iden, data in idata.items()}
         ##self.item_names = {t.name:t.id for t in self.items.values()}
-        self.actions = {iden:Action(data) for iden, data in adata.items()}
+        self.actions = {iden:data if isinstance(data, Action) else
+                             Action(data) for iden, data in adata.items()}
 
 
-        self.inventory = Inventory(mdata.get('inventory', None))
+        # Meta data can only give held Items by ID.
+        held = mdata.get('inventory', None)
+        if held is not None:
+            held = {bag: [self._IDtoItem(x) for x in items]
+                    for bag, items in held.items()}
+        limits = mdata.get('capacities', None)
+        self.inventory = Inventory(held, limits and dict(limits))
 
         self.parser = Parser(self.rooms, self.items,
                              self.actions, self.inventory)
+        # Sessions take their base's; see session.
+        self.commands = None if self.is_cow else \
+                        self._compileCommands(mdata.get('aliases'))
 
-        self._populate()
+        if not (self.is_lazy or self.is_cow): self._populate()
+        for action in self.actions.values():
+            if action.zero_code is None: action.compile(self._bpCompile)
 
         # For eventual implementation of meta-data entry.
         ## self._meta_processor(mdata)
@@ -132,37 +225,134 @@ class Game():
 
         init_loc = mdata.get('initialRoomName', "initial")
         self.loc = self.rooms[init_loc]
+        if not self.is_cow: self.loc.is_visited = True
 
         self.static_output = ''
-        self.dynamic_output = ''
+        # Everything put since the last gets().
+        self.output = Output_Buffer()
+        # Room ID: (Room, Room version, text); see _render.
+        self._renders = {}
+        # Built on first use; see graph.
+        self._graph = None
+        # Item ID: IDs of the Rooms holding it; built on first use, see
+        # _holders.
+        self._holding_index = None
 
         # --- Overarching Settings ---
         # Euclidean forces links to be irreflexive and symmetric.
         self.is_euclidean = mdata.get('isEuclidean', True)
 
+    @classmethod
+    def session(cls, base, mdata = None):
+        """ Starts a Game on base's world without copying it.
+
+            Rooms and Items are shared with base, which must not change
+            afterwards; the session copies one only when it is about to
+            change it, so its memory grows with what the player changed
+            rather than with the size of the world. """
+        G = cls(Overlay(base.rooms), Overlay(base.items), base.actions,
+                mdata or {})
+        G.base = base
+        G.parser = base.parser
+        aliases = (mdata or {}).get('aliases')
+        G.commands = G._compileCommands(aliases) if aliases else base.commands
+        return G
+
+    def trace(self, level = logging.DEBUG, name = None):
+        """ Logs this game's records from level up, whatever the level of
+            the other games, through a child of the module's logger. """
+        self.log = log.getChild(name or "game_%x" % id(self))
+        self.log.setLevel(level)
+        return self.log
+
     def _populate(self):
         for room in self.rooms.values():
-            R = lambda i: self._IDtoRoom(i) if i else None
-            try:
-                room.links = [R(x) for x in room.links]
-            except KeyError:
-                raise KeyError("Room {} has invalid links: {}".format(
-                                                     room,room.links))
-            try:
-                ##if V: print([t for t in room.holding])
-                room.holding = [self._IDtoItem(_) for _ in room.holding]
-            except KeyError:
-                raise KeyError("Room {} holding non-existent items: {}.".format(
-                                                             room,room.holding))
-            # TODO: Figure out why Inventory is already holding Items.
-            """
-        if self.inventory:
-            for location, bag in self.inventory.holding.items():
-                tmp_bag = {self._IDtoItem(_) for _ in bag}
-                self.inventory.holding[location] = tmp_bag
-            """
+            self._hydrateRoom(room)
         return
 
+    def _hydrateRoom(self, room):
+        """ Turns a Room's link and holding IDs into Rooms and Items. """
+        R = lambda i: self._IDtoRoom(i) if i else None
+        try:
+            room.links = [R(x) for x in room.links]
+            if room.exits:
+                room.exits = {d: R(x) for d, x in room.exits.items()}
+        except KeyError:
+            raise KeyError("Room {} has invalid links: {}".format(
+                                                 room,room.links))
+        try:
+            ##if V: print([t for t in room.holding])
+            room.holding = [self._IDtoItem(_) for _ in room.holding]
+        except NameError:
+            raise KeyError("Room {} holding non-existent items: {}.".format(
+                                                         room,room.holding))
+
+    def _holdingIDs(self, iden):
+        """ IDs of the Items a Room holds, without building a lazy Room. """
+        if self.is_lazy:
+            room = dict.get(self.rooms, iden)
+            if room is None or not room.isHydrated():
+                held = self.rooms.records[iden].get("hold", [])
+                return [held] if isinstance(held, str) else held
+        return [x.id for x in self.rooms[iden].holding]
+
+    def _holders(self, item):
+        """ The loaded Rooms holding an Item. """
+        if self._holding_index is None:
+            H = self._holding_index = {}
+            for iden in self.rooms:
+                for x in self._holdingIDs(iden):
+                    H.setdefault(x, set()).add(iden)
+        found = self._holding_index.get(item.id, ())
+        if not self.is_lazy: return [self.rooms[x] for x in found]
+        return [x for x in (dict.get(self.rooms, x) for x in found)
+                if x is not None and x.isHydrated()]
+
+    def _reindex(self, item, room):
+        """ Brings the holding index, if built, up to date with a Room. """
+        H = self._holding_index
+        if H is None or not isinstance(room, Room): return
+        if item in room: H.setdefault(item.id, set()).add(room.id)
+        else: H.get(item.id, set()).discard(room.id)
+
+    @property
+    def graph(self):
+        """ The RoomGraph of this game's Rooms, built on first use and
+            kept up to date by everything that changes a link. Sessions
+            share their base's until they change one. """
+        if self._graph is None:
+            if self.is_cow and not self._linksChanged():
+                self._graph = self.base.graph
+            else:
+                self._graph = RoomGraph((x, self._linkIDs(x))
+                                        for x in self.rooms)
+        return self._graph
+
+    def _linkIDs(self, iden):
+        """ Direction: ID of each of a Room's exits, without building a
+            lazy Room. """
+        if self.is_lazy:
+            room = dict.get(self.rooms, iden)
+            if room is None or not room.isHydrated():
+                record = self.rooms.records[iden]
+                out = dict(enumerate(record.get("links", [])))
+                out.update(record.get("exits") or {})
+                return out
+        return {d: x.id for d, x in self.rooms[iden].allExits()}
+
+    def _linksChanged(self):
+        """ Whether a session's Rooms link differently from its base's. """
+        B = self.base.rooms
+        return any(x.links != B[x.id].links or x.exits != B[x.id].exits
+                   for x in self.rooms.loaded())
+
+    def _relink(self, room):
+        """ Brings the graph, if built, up to date with a Room's links. """
+        if self._graph is None: return
+        if self.is_cow and self._graph is self.base._graph:
+            self._graph = self._graph.copy()
+        self._graph.setExits(room.id, {d: x.id for d, x in room.allExits()})
+
     # TODO: Integrate this into init; it's too sad on its own.
     #def _meta_processor(self, raw_mdata):
     #    try:
@@ -197,15 +387,64 @@ class Game():
             # The while loop complains if I don't do this.
             if len(prompt) < 1: prompt = ' '
 
+    def replay(self, commands, start = True):
+        """ Runs commands without a terminal, yielding each one's output.
+
+            commands is any iterable of lines, such as an open transcript.
+            Blank lines and lines starting with # are skipped and quitting
+            ends the replay. With start, the opening text comes first. """
+        if start:
+            self.main()
+            yield self.gets()
+        for line in commands:
+            line = line.strip()
+            if not line or line[0] == '#': continue
+            self.prompt_exe(line)
+            yield self.gets()
+            if line.split()[0].lower() in ('q', 'quit'): return
+
+    def replayFile(self, filename, start = True):
+        """ replay() over a transcript file, one command per line. """
+        with open(filename) as F:
+            yield from self.replay(F, start)
+
     def _room_update(self):
         """ Adds item and setting information to the output buffer. """
-        room_info = self.loc.onEntry() + '\n'
-
-        item_info = Item.item_printer(self.loc.holding)
-        if item_info:
-            room_info += item_info + '\n'
-
-        self._puts(room_info, True)
+        I = self.instruments
+        if I is not None: start = time.perf_counter()
+
+        self._puts(self._render(self.loc), True)
+        if I is not None: I.record("room_update", time.perf_counter() - start)
+
+    def _render(self, room):
+        """ A Room's text, rendered again only once the Room, or an Item
+            in it, has changed (see _unrender). """
+        cached = self._renders.get(room.id)
+        if cached is not None and cached[0] is room and \
+                cached[1] == room.version:
+            return cached[2]
+
+        # Rooms may be shared with other games, so this mustn't change them.
+        chunks = [room.describe(), '\n']
+        Item.item_printer(self._current(room.holding), chunks)
+        if len(chunks) > 2: chunks.append('\n')
+        room_info = ''.join(chunks)
+
+        self._renders[room.id] = (room, room.version, room_info)
+        return room_info
+
+    def _unrender(self, item):
+        """ Forgets the rendered text of the Rooms holding item. """
+        R = self._renders
+        for iden in [k for k, x in R.items() if item in x[0].holding]:
+            del R[iden]
+
+    def stream(self):
+        """ gets(), as the pieces the output was built from. """
+        self._room_update()
+        yield self.static_output
+        yield '\n'
+        yield from self.output.drain()
 
     """ Functions involved in passing to GUI_Holder class. """
 
@@ -215,66 +454,147 @@ class Game():
         if is_static:
             self.static_output = input_string
         else:
-            self.dynamic_output += input_string + '\n'
+            self.output.append(input_string)
+            self.output.append('\n')
 
     def gets(self):
         """ Returns text from the output buffer and clears it. """
+        I = self.instruments
+        if I is not None: start = time.perf_counter()
+
         self._room_update()
-        returning = self.static_output + '\n' + self.dynamic_output
-        self.dynamic_output = ''
+        returning = self.static_output + '\n' + self.output.getvalue()
+        self.output.clear()
+
+        if I is not None: I.record("gets", time.perf_counter() - start)
         return returning
 
 # ------------------------------- User Methods ---------------------------------
 
     def prompt_exe(self, prompt):
-        """ Takes user input and passes it to the appropriate method. """
-        # Strings to arrays of lower-case words.
-        # ["strings", "to", "arrays", "of", "words"]
-        i = prompt.lower().split() if prompt else ''
+        """ Takes user input and passes it to the appropriate method.
 
-        # TODO: implement aliases
-        # gsub
+            Whatever the command changes is journaled as one undo step. """
+        with self._undoStep():
+            I = self.instruments
+            if I is None:
+                self._execute(prompt)
+            else:
+                I.count("commands")
+                I.time("command", self._execute, prompt)
+
+    def instrument(self, instruments = None):
+        """ Starts timing this game's commands; returns the Instruments. """
+        self.instruments = instruments or Instruments()
+        return self.instruments
+
+    @staticmethod
+    def _tokenize(prompt):
+        """ Strings to arrays of lower-case words. """
+        return prompt.lower().split() if prompt else ''
+
+    def _compileCommands(self, aliases = None):
+        """ Builds the table prompt_exe routes a command's first word by.
+
+            Every action, direction, system command and alias gets an
+            entry, as does every prefix (of at least prefix_min letters)
+            of one of them that no other word starts with; prefixes shared
+            by several words are marked ambiguous. Entries are (method
+            name, words to put in place of the first word, or None).
+            The world's actions win over the built-in words they share. """
+        routes = dict.fromkeys(self.directions, '_moveCommand')
+        routes.update(self.system_commands)
+        routes.update(dict.fromkeys(self.special_actions, '_actCommand'))
+        routes.update(dict.fromkeys(self.actions, '_actCommand'))
+
+        table = {w: (r, None) for w, r in routes.items()}
+        wanted = {w: x for w, x in self.aliases.items() if w not in routes}
+        wanted.update(aliases or {})
+        for word, target in wanted.items():
+            words = target.lower().split()
+            if words and words[0] in routes:
+                table[word.lower()] = (routes[words[0]], words)
+
+        prefixes = {}
+        for word, (route, words) in table.items():
+            for n in range(self.prefix_min, len(word)):
+                p = word[:n]
+                if p in table: continue
+                prefixes[p] = ('_ambiguousCommand', None) if p in prefixes \
+                              else (route, words or [word])
+        table.update(prefixes)
+        return table
+
+    def _execute(self, prompt):
+        # ["strings", "to", "arrays", "of", "words"]
+        I = self.instruments
+        if I is None: i = self._tokenize(prompt)
+        else: i = I.time("tokenize", self._tokenize, prompt)
 
         # Does nothing if empty command is entered.
         # TODO: Allow thing to be configurable!
         #       E.G., aliasing '' to "wait".
-        if len(i) < 1: pass
-
-        # Call _move if a cardinal direction is entered.
-        #   Accepts full names and (w|s|n|e).
-        elif i[0] in self.cardinals.keys():
-            self._movePlayer(i[0])
-        elif i[0] in ['west', 'south', 'north', 'east']:
-            self._movePlayer(i[0][0])
-
-        # Inventory call.
-        elif i[0] in ["inv", "i"]:
-            # Prints the contents of the inventory.
-            # TODO: When the Actor class is properly integrated and Inventory
-            #       is an attribute, make sure to patch this accordingly.
-            self._puts(str(self.inventory))
-
-        # Call _act if an action is entered.
-        # All terms for actions are stored as keys 
-        elif i[0] in self.actions or \
-             i[0] in self.special_actions:
-            if V: print("Treating ", i[0], " as an action.")
-            self._act(i)
+        if len(i) < 1: return
+
+        # A Room's own exits come first, then whatever the command table
+        # routes the first word to: a direction, an action or a system
+        # command. Aliases and prefixes are replaced by what they stand for.
+        if self.loc.exits and i[0] in self.loc.exits:
+            return self._movePlayer(i[0])
+        route = self.commands.get(i[0])
+        if route is not None:
+            method, words = route
+            if words is not None: i = words + i[1:]
+            return getattr(self, method)(i)
 
         # System calls. ? calls help.
         #!! Needs to be worked out.
-        elif i[0][0] == '?':
+        if i[0][0] == '?':
             self._help(i[0].count('?'), "".join(i[1:]))
 
-        # Puts Quit message.
-        elif i[0] == 'quit' or i[0] == 'q':
-            self._puts(self.GAME_MSGS["quit"])
-
         # Puts an error message if an unrecognised command is entered.
         else:
             self._puts(self.ERROR["exe_pass"])
 
-        return
+    # Command handlers, by the names _compileCommands routes to. They're
+    # looked up on every command, so they can be replaced or patched.
+
+    def _moveCommand(self, i):
+        self._movePlayer(self.directions[i[0]])
+
+    def _goCommand(self, i):
+        if i[1:2] == ["to"]:
+            self._goTo(' '.join(i[2:]))
+        elif len(i) == 2:
+            self._movePlayer(self.directions.get(i[1], i[1]))
+        else:
+            self._puts(self.ERROR["go_where"])
+
+    def _undoCommand(self, i):
+        steps = int(i[1]) if len(i) > 1 and i[1].isdigit() else 1
+        if self.rollback(steps):
+            self._puts(self.GAME_MSGS["undo"])
+        else:
+            self._puts(self.ERROR["undo_empty"])
+
+    def _lookCommand(self, i):
+        """ gets() always shows the room, so there's nothing more to do. """
+        pass
+
+    def _invCommand(self, i):
+        # TODO: When the Actor class is properly integrated and Inventory
+        #       is an attribute, make sure to patch this accordingly.
+        self._inv("open")
+
+    def _actCommand(self, i):
+        self.log.debug("Treating %s as an action.", i[0])
+        self._act(i)
+
+    def _quitCommand(self, i):
+        self._puts(self.GAME_MSGS["quit"])
+
+    def _ambiguousCommand(self, i):
+        self._puts(self.ERROR["ambiguity"])
 
     def _help(self, magnitude, arg):
         """ Puts help messages. """
@@ -292,10 +612,13 @@ class Game():
 
     def _local(self):
         """ Returns a list of Items near the player. """
-        return self.loc.holding+list(self.inventory)
+        return list(self.loc.holding) + list(self.inventory)
 
     def _IDtoRoom(self, id):
         """ Returns a Room instance R such that R.id = id. """
+        if isinstance(id, Room):
+            if not self.is_cow: return id
+            id = id.id
         try:
             return self.rooms[id]
         except KeyError:
@@ -323,17 +646,69 @@ class Game():
                 raise KeyError("Tried to access {}, but no bag exists with " +
                                "that name.".format(scope[5:]))
         elif scope == "around":
-            val_list = self.loc.holding
+            val_list = list(self.loc.holding)
         elif scope == "local":
-            val_list = self.loc.holding+list(self.inventory)
+            val_list = list(self.loc.holding) + list(self.inventory)
         elif scope == "global":
-            val_list = list(self.items.values)
+            val_list = list(self.items.values())
         else:
             raise InvalidBranchError("A bad scope was specified.") 
-        return val_list
+        return self._current(val_list)
+
+    def _current(self, items):
+        """ Swaps shared Items for this game's copies, if it has any. """
+        if not self.is_cow: return items
+        return [self._IDtoItem(x) for x in items]
+
+    def _writable(self, obj):
+        """ Returns the version of a Room or Item this game may change. """
+        if not self.is_cow:
+            key = (isinstance(obj, Room), obj.id)
+            if key not in self.pristine: self.pristine[key] = obj.state()
+            return obj
+        if isinstance(obj, Room):
+            obj = self.rooms.writable(obj.id)
+            if obj.id == self.loc.id: self.loc = obj
+            return obj
+        return self.items.writable(obj.id)
+
+    def _scopeContainers(self, scope):
+        """ Returns the containers making up a scope, or None if the
+            scope has to be searched item by item. """
+        if scope == "held":
+            return [self.inventory]
+        elif scope == "around":
+            return [self.loc]
+        elif scope == "local":
+            return [self.loc, self.inventory]
+        return None
+
+    def _scopeIndexes(self, scope):
+        """ Returns the NameIndexes covering a scope, or None. """
+        containers = self._scopeContainers(scope)
+        if containers is None: return None
+        return [x.names for x in containers]
+
+    def _renamedLookup(self, item_name, found, scope):
+        """ Corrects name index results for Items this session renamed.
+
+            Shared Rooms still file those under their old names, so they
+            are checked by hand against their current ones. """
+        key = NameIndex.normalize(item_name)
+        found = [x for x in found
+                 if x.id not in self.renamed or key in NameIndex.keys(x)]
+        for iden in self.renamed:
+            x = self.items[iden]
+            if key in NameIndex.keys(x) and x not in found:
+                found.extend(x for C in self._scopeContainers(scope)
+                               if x in C)
+        return found
 
     def _IDtoItem(self, id, scope="global"):
         """ Returns an Item instance W such that W.id = id. """
+        if isinstance(id, Item):
+            if not self.is_cow: return id
+            id = id.id
         try:
             return self.items[id]
         except KeyError:
@@ -346,9 +721,16 @@ class Game():
             If no item found, puts the appropriate error message and
                 returns None.
         """
-        search_arr = [x for x in self._scopeGetter(scope)
-                              if (item_name == x.name or
-                                  item_name == x.nickname)]
+        indexes = self._scopeIndexes(scope)
+        if indexes is not None:
+            search_arr = self._current(
+                            [x for I in indexes for x in I.get(item_name)])
+            if self.is_cow and self.renamed:
+                search_arr = self._renamedLookup(item_name, search_arr, scope)
+        else:
+            search_arr = [x for x in self._scopeGetter(scope)
+                                  if (item_name == x.name or
+                                      item_name == x.nickname)]
 
         out = None
         if len(search_arr) == 1:
@@ -359,21 +741,222 @@ class Game():
             self._puts(self.ERROR["item_not_found"])
         return out
 
+# -------------------------------- Snapshots -----------------------------------
+# Only what the player changed is saved: the location, the inventory and the
+# Rooms and Items that differ from the world the game started with.
+
+    SNAPSHOT = struct.Struct('<4sH')
+    SNAPSHOT_MAGIC = b'ARCS'
+    SNAPSHOT_VERSION = 3
+
+    def _changed(self):
+        """ Rooms and Items changed since the game started. """
+        if self.is_cow:
+            return self.rooms.loaded(), self.items.loaded()
+        return ([self.rooms[i] for is_room, i in self.pristine if is_room],
+                [self.items[i] for is_room, i in self.pristine if not is_room])
+
+    def snapshot(self):
+        """ Returns the game's progress as bytes, for restore. """
+        rooms, items = self._changed()
+        state = [self.loc.id,
+                 {bag: [x.id for x in held]
+                  for bag, held in self.inventory.holding.items()},
+                 {x.id: x.state() for x in rooms},
+                 {x.id: x.state() for x in items}]
+        return self.SNAPSHOT.pack(self.SNAPSHOT_MAGIC,
+                                  self.SNAPSHOT_VERSION) + pack(state)
+
+    def restore(self, blob):
+        """ Puts the game back in the state a snapshot was taken in.
+
+            The snapshot must come from a game of the same world. """
+        magic, version = self.SNAPSHOT.unpack_from(blob, 0)
+        if magic != self.SNAPSHOT_MAGIC:
+            raise ValueError("Not a game snapshot.")
+        if version != self.SNAPSHOT_VERSION:
+            raise ValueError("Snapshot is version {}; expected {}.".format(
+                                             version, self.SNAPSHOT_VERSION))
+        (loc, inventory, rooms, items), _ = unpack(blob, self.SNAPSHOT.size)
+        self._holding_index = None
+
+        renamed = []
+        if self.is_cow:
+            changed = list(dict.keys(self.rooms))
+            dict.clear(self.rooms)
+            dict.clear(self.items)
+            for iden in changed: self._relink(self.rooms[iden])
+        else:
+            # Undo changes the snapshot doesn't know about.
+            for key, state in list(self.pristine.items()):
+                is_room, iden = key
+                if iden in (rooms if is_room else items): continue
+                del self.pristine[key]
+                if is_room: self._setRoomState(self.rooms[iden], state)
+                else: self._setItemState(self.items[iden], state, renamed)
+
+        for iden, state in items.items():
+            item = self._writable(self._IDtoItem(iden))
+            self._setItemState(item, state, renamed)
+        for iden, state in rooms.items():
+            self._setRoomState(self._writable(self._IDtoRoom(iden)), state)
+
+        # The Parser keeps the Inventory, so it's refilled in place.
+        self.inventory.holding = OrderedDict(
+                            (bag, [self._IDtoItem(x) for x in held])
+                            for bag, held in inventory.items())
+        self.loc = self._IDtoRoom(loc)
+        self._restoreNames(renamed)
+        self._renders.clear()
+        # Journalled inverses describe the state before the restore.
+        self.journal.clear()
+
+    def _setItemState(self, item, state, renamed):
+        old_keys = NameIndex.keys(item)
+        item.setState(state)
+        if NameIndex.keys(item) != old_keys: renamed.append((item, old_keys))
+
+    def _setRoomState(self, room, state):
+        room.setState(state, self._IDtoRoom, self._IDtoItem)
+        self._relink(room)
+
+    def _restoreNames(self, renamed):
+        """ Brings name lookups up to date after a restore. """
+        if self.is_cow:
+            B = self.base.items
+            self.renamed = {x.id for x in self.items.loaded()
+                            if NameIndex.keys(x) != NameIndex.keys(B[x.id])}
+            if not self.renamed:
+                self.parser = self.base.parser
+                return
+            if self.parser is self.base.parser:
+                self.parser = Parser(self.rooms, self.items,
+                                     self.actions, self.inventory)
+            self.parser.vocabChanged()
+        elif renamed:
+            self.parser.vocabChanged()
+            for item, old_keys in renamed:
+                for room in self._holders(item):
+                    room.names.rename(item, old_keys)
+
+# ------------------------------- Undo Journal ---------------------------------
+# Engine methods journal how to undo what they did as (function, arguments)
+# pairs, using IDs so they apply to copy-on-write copies as well. Changes
+# made outside prompt_exe are journaled as steps of their own.
+
+    def _journal(self, op, *args):
+        if self._step is None: self.journal.append([(op, args)])
+        else: self._step.append((op, args))
+
+    @contextmanager
+    def _undoStep(self):
+        """ Journals everything done inside as one step, unless a step
+            is already being recorded. """
+        if self._step is not None:
+            yield
+            return
+        self._step = []
+        try:
+            yield
+        finally:
+            if self._step: self.journal.append(self._step)
+            self._step = None
+
+    def rollback(self, steps = 1):
+        """ Undoes the latest steps; returns how many were undone. """
+        done = 0
+        # Undoing journals its own inverses; they're thrown away.
+        step, self._step = self._step, []
+        try:
+            while done < steps and self.journal:
+                for op, args in reversed(self.journal.pop()):
+                    op(self, *args)
+                done += 1
+        finally:
+            self._step = step
+        return done
+
+    def _whereIs(self, item, container):
+        """ Where item sits in a container, so it can be put back there. """
+        if isinstance(container, Inventory): return container.find(item)
+        return container.holding.position(item)
+
+    def _journalAdded(self, item, container, where):
+        """ Journals item having been added to a container.
+            where is _whereIs from before the change. """
+        if isinstance(container, Inventory):
+            if where is None:
+                self._journal(Game._remove, item.id, '_',
+                              container.find(item))
+        else:
+            self._journal(Game._remove, item.id, container.id)
+
+    def _journalRemoved(self, item, container, where):
+        if where is None: return
+        if isinstance(container, Inventory):
+            self._journal(Game._add, item.id, '_', where)
+        else:
+            self._journal(Game._insert, item.id, container.id, where)
+
+    def _insert(self, item, room, key):
+        room, item = self._writable(self._IDtoRoom(room)), self._IDtoItem(item)
+        room.insert(key, item)
+        self._reindex(item, room)
+        self._journal(Game._remove, item.id, room.id)
+
+    def _setLink(self, room, dir, dest):
+        room = self._writable(self._IDtoRoom(room))
+        old = room.exit(dir)
+        self._journal(Game._setLink, room.id, dir, old and old.id)
+        room.setExit(dir, self._IDtoRoom(dest) if dest else None)
+        self._relink(room)
+
+    def _setLoc(self, room):
+        self._journal(Game._setLoc, self.loc.id)
+        self.loc = self._IDtoRoom(room)
+        # A session's Rooms are shared with its base, so it doesn't mark them.
+        if not self.is_cow: self.loc.is_visited = True
+
 # ------------------------- User-Engine Interface ------------------------------
 # Includes some simple Engine methods (_movePlayer, let's be real here) and
 # the first component of the Action pipeline.
 
     def _movePlayer(self, direction):
         """ Attempts to change self.loc in response to movement commands. """
-        # Transforms letters to Room.links array index (0-3).
-        translated_direction = self.cardinals[direction[0][0]]
-        destination = self.loc.links[translated_direction]
+        # Letters become Room.links indices (0-3); other exits go by name.
+        destination = self.loc.exit(self.cardinals.get(direction, direction))
 
         if destination is not None: 
-            self.loc = destination 
+            self._setLoc(destination)
         else: 
             self._puts("I can't go that way.")
 
+    def _goTo(self, name):
+        """ Walks the player to the nearest Room with the given name or ID. """
+        name = NameIndex.normalize(name)
+        if not name: return self._puts(self.ERROR["go_where"])
+
+        graph = self.graph
+        dest = graph.find(name)
+        if dest is not None: steps = graph.path(self.loc.id, dest)
+        else:
+            steps = graph.search(self.loc.id, lambda iden:
+                    NameIndex.normalize(self._roomName(iden)) == name)
+
+        if steps is None: return self._puts(self.ERROR["go_unknown"])
+        if not steps: return self._puts(self.ERROR["go_here"])
+        # One hop at a time, so the journal holds the whole walk as a step.
+        with self._undoStep():
+            for _, room in steps: self._setLoc(room)
+
+    def _roomName(self, iden):
+        """ A Room's name, without building a lazy Room. """
+        if self.is_lazy:
+            room = dict.get(self.rooms, iden)
+            if room is None or not room.isHydrated():
+                return self.rooms.records[iden].get("name", '')
+        return self.rooms[iden].name
+
     # Act: Takes a command.
     # Deprecated by new action system.
     """
@@ -416,23 +999,23 @@ class Game():
     def _act(self, command):
         # TODO: Write an actual docstring.
         """ Does actiony stuff. Don't ask me! """
-        if V: print("Running action prompt.")
+        self.log.debug("Running action prompt.")
 
         # Parses input as [action, specifics*].
         action = command[0]
         specifics = ' '.join(command[1:])
 
         if action in self.special_actions:
-            if V: print("Special action being run.")
+            self.log.debug("Special action being run.")
             self._specialAct(action, specifics)
 
         # User-specified actions.
         elif action in self.actions:
-            if V: print("Ordinary action being run.")
+            self.log.debug("Ordinary action being run.")
             self._userAct(action, specifics)
 
         else:
-            print("Non-action. Why are we here?")
+            self.log.error("Non-action %s. Why are we here?", action)
             raise InvalidBranchError("I'm freakin' out, man! Check Game._act!")
         return
 
@@ -441,16 +1024,24 @@ class Game():
 
             ... is this necessary? """
         if action == "take":
+            # The parser finds the name in "the blue bauble"; anything it
+            # can't is left to _itemNametoItem to complain about.
+            I, parse = self.instruments, self.parser.actionParse
+            take = self.special_actions[action]
+            if I is None: names = parse(take, specifics)
+            else: names = I.time("actionParse", parse, take, specifics)
+            if type(names) is list and names: specifics = names[0]
             specifics = self._itemNametoItem(specifics)
-            ## elif specifics in self.inventory.holding:
-            ##     self._puts(self.ERROR["act_already_holding"])
             if specifics is not None:
-                if V: print("Taking: ", specifics)
-                if specifics.isProp:
+                self.log.debug("Taking %s.", specifics.id)
+                if specifics in self.inventory:
+                    self._puts(self.ERROR["act_already_holding"])
+                elif specifics.isProp:
                     self._puts(self.ERROR["act_taking_prop"])
+                elif not self.inventory.canHold(specifics):
+                    self._puts(self.ERROR["act_too_heavy"])
                 else:
-                    self.inventory.add(specifics)
-                    self.loc.holding.remove(specifics)
+                    self._move(specifics, self.loc, '_')
                     self._puts("Picked up the " + specifics.name + ".")
 
     def _userAct(self, action, specifics):
@@ -462,7 +1053,9 @@ class Game():
         # Transforms specifics into either an error message string
         # or an array of Item names.
         # See Parser.actionParse.__doc__.
-        specifics = self.parser.actionParse(action, specifics)
+        I, parse = self.instruments, self.parser.actionParse
+        if I is None: specifics = parse(action, specifics)
+        else: specifics = I.time("actionParse", parse, action, specifics)
 
         # If parseString returns a "$! " prefixed string, put
         # an error message.
@@ -471,109 +1064,204 @@ class Game():
 
         # Turns the parsed string into (hopefully) an array of Item IDs.
         else:
-            if V: print(specifics)
+            self.log.debug("Parsed %s.", specifics)
 
             # Setting specifics to a list of Item instances.
-            specifics = [self._itemNametoItem(_) for _ in specifics] \
-                                                 if specifics else 0
-            if V:
-                print("Specifics generated:")
-                try:
-                    for _ in specifics:
-                        print("{}".format(_.id))
-                except AttributeError:
-                    print("{} is not an Item!".format(_))
-                except TypeError:
-                    print("{} is 0!".format(specifics))
-
-            if None not in specifics:
-                bp_code = action.call(specifics)
-                if V: print("Generated BP Code: {}".format(bp_code))
-                for x in bp_code: self._bpRouter(self.parser.bpParse(x))
+            find = self._itemNametoItem
+            if not specifics: specifics = 0
+            elif I is None: specifics = [find(_) for _ in specifics]
+            else: specifics = [I.time("itemNametoItem", find, _)
+                               for _ in specifics]
+            if self.log.isEnabledFor(logging.DEBUG):
+                self.log.debug("Specifics generated: %s", specifics and
+                               [getattr(_, "id", _) for _ in specifics])
+
+            if specifics == 0 or None not in specifics:
+                if I is None: bp_code = action.call(specifics, True)
+                else: bp_code = I.time("call", action.call, specifics, True)
+                self.log.debug("Generated BP Code: %s", bp_code)
+                self._bpRun(bp_code)
 
     def _inv(self, command):
         """ Inventory menu commands. """
         if command == "open":
-            self._puts(self.inventory.__str__())
+            # Prints the contents of the inventory.
+            self.inventory.write(self.output, self._current)
+            self.output.append('\n')
         else: pass
         return
 
 # ------------------------------ Engine Methods --------------------------------
 # Used in BP Code implementation.
 
-    def _bpRouter(self, args):
-        if args == "pass": return
-        else: getattr(self, '_'+args[0])(*args[1])
+    def _bpCompile(self, code):
+        """ Turns a line of BP code into an instruction.
+
+            An instruction is an (engine method, arguments) pair with Room
+            and Item IDs already resolved; _bpRun executes it without any
+            further parsing. Returns None for 'pass'. """
+        I = self.instruments
+        if I is None: parsed = self.parser.bpParse(code)
+        else: parsed = I.time("bpParse", self.parser.bpParse, code)
+        if parsed == "pass": return None
+        command, parameters = parsed
+
+        resolve = {
+            'item': self._IDtoItem,
+            'room': self._IDtoRoom,
+            'container': lambda x: x if x == '_' else self._IDtoRoom(x),
+            }
+        kinds = self.BP_OPERANDS.get(command, ())
+        args = tuple(resolve[k](x) if k in resolve else x
+                     for k, x in zip(kinds, parameters))
+        args += tuple(parameters[len(args):])
+
+        try:
+            return (getattr(Game, '_'+command), args)
+        except AttributeError:
+            raise KeyError("Attempted to call the %s command."%command)
+
+    def _bpRun(self, program):
+        """ Executes a list of instructions built by _bpCompile. """
+        I = self.instruments
+        if I is None:
+            for op, args in program: op(self, *args)
+        else:
+            for op, args in program:
+                I.time("dispatch." + op.__name__[1:], op, self, *args)
 
     def _add(self, item, container, target = None):
         """ Adds an Item to a container. """
         item = self._IDtoItem(item)
-        if container == '_':
-            container = self.inventory
+        container = self._container(container)
+        where = self._whereIs(item, container)
+        if container is self.inventory:
             container.add(item, target)
         else:
-            container = self._IDtoRoom(container)
             container.add(item)
+            self._reindex(item, container)
+        self._journalAdded(item, container, where)
 
     def _remove(self, item, container, target = None):
         """ Removes an Item from a container. """
         item = self._IDtoItem(item)
-        if container == '_':
-            container = self.inventory
+        container = self._container(container)
+        where = self._whereIs(item, container)
+        if container is self.inventory:
+            if target is not None and target != where: where = None
             container.remove(item, target)
         else:
-            container = self._IDtoRoom(container)
             container.remove(item)
+            self._reindex(item, container)
+        self._journalRemoved(item, container, where)
+
+    def _exitKey(self, word):
+        """ The key Rooms file an exit under, for a direction word. """
+        word = self.directions.get(word.lower(), word.lower())
+        return self.cardinals.get(word, word)
 
     def _link(self, source, dir, dest):
-        dir = self.cardinals[dir.lower()]
-        source = self._IDtoRoom(source)
-        dest = self._IDtoRoom(dest)
+        dir = self._exitKey(dir)
+        source = self._writable(self._IDtoRoom(source))
+        dest = self._writable(self._IDtoRoom(dest))
 
+        back = Room.opposite.get(dir)
+        old = source.exit(dir)
+        old_back = dest.exit(back) if back is not None else None
         source.link(dest, dir, self.is_euclidean)
+        self._relink(source)
+        if self.is_euclidean: self._relink(dest)
+        with self._undoStep():
+            self._journal(Game._setLink, source.id, dir, old and old.id)
+            if self.is_euclidean and back is not None:
+                self._journal(Game._setLink, dest.id, back,
+                              old_back and old_back.id)
 
     def _move(self, moved_item, source, target):
         """ Removes moved_item from source and adds it to target. """
-        if moved_item in source:
+        moved_item = self._IDtoItem(moved_item)
+        source, target = self._container(source), self._container(target)
+        if moved_item not in source:
+            raise AttributeError("Item not in source.")
+        with self._undoStep():
+            where = self._whereIs(moved_item, target)
             try:
-                target.add(moved_item)
+                # Inventories return -1 when they've no room left.
+                if target.add(moved_item) == -1: return
             except AttributeError:
                 raise AttributeError("Target lacks add() method.")
+            self._reindex(moved_item, target)
+            self._journalAdded(moved_item, target, where)
+            where = self._whereIs(moved_item, source)
             try:
                 source.remove(moved_item)
             except AttributeError:
                 raise AttributeError("Source lacks remove() method.")
-        else:
-            raise AttributeError("Item not in source.")
+            self._reindex(moved_item, source)
+            self._journalRemoved(moved_item, source, where)
         return
 
+    def _container(self, container):
+        """ Resolves a Blueprint container: _ is the inventory,
+            strings are Room IDs. """
+        if container == '_': return self.inventory
+        elif isinstance(container, (str, Room)):
+            return self._writable(self._IDtoRoom(container))
+        return container
+
     def _addProperty(self, item, property):
-        item = self._IDtoItem(item)
+        item = self._writable(self._IDtoItem(item))
+        if not item.hasProperty(property):
+            self._journal(Game._removeProperty, item.id, property)
         item.setProperty(property)
 
     def _removeProperty(self, item, property):
-        item = self._IDtoItem(item)
+        item = self._writable(self._IDtoItem(item))
+        if item.hasProperty(property):
+            self._journal(Game._addProperty, item.id, property)
         item.setProperty(property, False)
 
     def _changeItem(self, item, attr, text):
-        item = self._IDtoItem(item)
+        item = self._writable(self._IDtoItem(item))
         if '_desc' in attr:
-            print("WARNING: You should be calling changeDescription.")
+            self.log.warning("You should be calling changeDescription.")
             return
+        # Blueprint uses the short JSON codes (nick, ...) for attributes.
+        attr = Item.codes.get(attr, attr)
+        old_keys = NameIndex.keys(item)
         try:
+            old = getattr(item, attr)
             setattr(item, attr, text)
         except AttributeError:
             raise AttributeError("%s is not an item attribute."%attr)
+        self._journal(Game._changeItem, item.id, attr, old)
+        self._unrender(item)
+        if attr in ('name', 'nickname'):
+            if self.base is not None and self.parser is self.base.parser:
+                # Stop sharing base's grammars once names diverge.
+                self.parser = Parser(self.rooms, self.items,
+                                     self.actions, self.inventory)
+            self.parser.vocabChanged()
+            if self.is_cow:
+                self.renamed.add(item.id)
+                return
+            # Rooms not loaded yet index the new name when they load.
+            for room in self._holders(item):
+                room.names.rename(item, old_keys)
+            if item in self.inventory:
+                self.inventory.names.rename(item, old_keys)
 
     def _changeDescription(self, object, type, index=0, text=''):
         pass
 
     def _changeRoom(self, room, attr, text):
-        room = self._IDtoRoom(room)
+        room = self._writable(self._IDtoRoom(room))
         try:
+            old = getattr(room, attr)
             setattr(room, attr, text)
         except AttributeError:
             raise AttributeError("%s is not a room attribute."%attr)
+        self._journal(Game._changeRoom, room.id, attr, old)
 
     def _changeInv(self, bag, attr, text):
         inv = self.inventory()
@@ -0,0 +1,151 @@
+""" graph.py
+        An index of the exits between Rooms.
+
+        Rooms only know their own links, so anything about the world as a
+    whole (how to get from one Room to another, what can be reached at
+    all) would otherwise have to walk Room objects by hand. RoomGraph keeps
+    the exits as small integers, keyed by Room ID, and answers those
+    questions with breadth-first searches over them. Game keeps one in
+    step with its Rooms; see Game.graph.
+"""
+
+class RoomGraph:
+    """ Room IDs and the exits between them.
+
+        exits is an iterable of (room ID, links) pairs, where links is
+        either a list of Room IDs by direction index or a dict of
+        direction: Room ID. Missing exits are None. """
+    def __init__(self, exits = ()):
+        self.ids = []
+        self.number = {}
+        # Lower-cased ID: ID, for commands typed by players; see find.
+        self.folded = {}
+        self.exits = []
+        for iden, links in exits: self.setExits(iden, links)
+
+    def __contains__(self, iden):
+        return iden in self.number
+
+    def __len__(self):
+        return len(self.ids)
+
+    def node(self, iden):
+        """ The number of a Room ID, adding it if needed. """
+        n = self.number.get(iden)
+        if n is None:
+            n = self.number[iden] = len(self.ids)
+            self.ids.append(iden)
+            self.folded.setdefault(iden.lower(), iden)
+            self.exits.append({})
+        return n
+
+    def find(self, iden):
+        """ The Room ID matching iden whatever its case, or None. """
+        return iden if iden in self.number else self.folded.get(iden.lower())
+
+    def setExits(self, iden, links):
+        """ Replaces every exit of a Room. """
+        pairs = links.items() if hasattr(links, "items") else enumerate(links)
+        N = self.node
+        self.exits[N(iden)] = {d: N(x) for d, x in pairs if x}
+
+    def link(self, source, dir, dest):
+        """ Sets one exit; a dest of None removes it. """
+        exits = self.exits[self.node(source)]
+        if dest: exits[dir] = self.node(dest)
+        else: exits.pop(dir, None)
+
+    def copy(self):
+        new = RoomGraph.__new__(RoomGraph)
+        new.ids, new.number = list(self.ids), dict(self.number)
+        new.folded = dict(self.folded)
+        new.exits = [dict(x) for x in self.exits]
+        return new
+
+    # ----------------------------- Queries ------------------------------
+
+    def distances(self, sources, limit = None):
+        """ Steps from the nearest of sources (one ID or several) to each
+            Room reachable within limit steps, nearest first. """
+        if isinstance(sources, str): sources = [sources]
+        frontier = [self.number[x] for x in sources]
+        dist = dict.fromkeys(frontier, 0)
+        exits, depth = self.exits, 0
+        while frontier and (limit is None or depth < limit):
+            depth += 1
+            found = []
+            for n in frontier:
+                for m in exits[n].values():
+                    if m not in dist:
+                        dist[m] = depth
+                        found.append(m)
+            frontier = found
+        ids = self.ids
+        return {ids[n]: d for n, d in dist.items()}
+
+    def within(self, sources, k):
+        """ IDs of the Rooms at most k steps away. """
+        return list(self.distances(sources, k))
+
+    def reachable(self, source):
+        return set(self.distances(source))
+
+    def unreachable(self, source):
+        """ IDs of the Rooms there's no way to get to from source. """
+        seen = self.distances(source)
+        return [x for x in self.ids if x not in seen]
+
+    def path(self, source, dest):
+        """ The shortest list of (direction, Room ID) steps from source to
+            dest; [] if they're the same Room, None if dest can't be
+            reached. """
+        if dest not in self.number: raise KeyError(dest)
+        return self.search(source, lambda iden: iden == dest)
+
+    def search(self, source, test):
+        """ Steps, as path gives them, to the nearest Room whose ID passes
+            test; None if no reachable Room does. """
+        start, ids = self.number[source], self.ids
+        parent = {start: None}
+        frontier, exits = [start], self.exits
+        goal = start if test(source) else None
+        while frontier and goal is None:
+            found = []
+            for n in frontier:
+                for d, m in exits[n].items():
+                    if m not in parent:
+                        parent[m] = (n, d)
+                        found.append(m)
+                        if test(ids[m]):
+                            goal = m
+                            break
+                if goal is not None: break
+            frontier = found
+        if goal is None: return None
+
+        steps, n = [], goal
+        while parent[n] is not None:
+            back, d = parent[n]
+            steps.append((d, ids[n]))
+            n = back
+        steps.reverse()
+        return steps
+
+    def components(self):
+        """ Lists of the Room IDs joined by exits in either direction. """
+        root = list(range(len(self.ids)))
+        def find(n):
+            while root[n] != n:
+                root[n] = root[root[n]]
+                n = root[n]
+            return n
+
+        for n, exits in enumerate(self.exits):
+            for m in exits.values():
+                a, b = find(n), find(m)
+                if a != b: root[b] = a
+
+        groups = {}
+        for n, iden in enumerate(self.ids):
+            groups.setdefault(find(n), []).append(iden)
+        return list(groups.values())
@@ -1,10 +1,11 @@
+import logging
 import tkinter as tk
 from collections import OrderedDict
 from idlelib.WidgetRedirector import WidgetRedirector
 
 import architect.game as game
 
-verbose = False
+log = logging.getLogger(__name__)
 
 # Credit to tkinter.unpythonic.net/wiki/ReadOnlyText.
 class ReadOnlyText(tk.Text):
@@ -58,14 +59,14 @@ class GUI_Holder(tk.Tk):
             Game class. Otherwise faciliates passing and receiving
             information. """
             
-        print("## Calling game. ##")
+        log.debug("Calling game.")
         if entered_text in ['q', 'quit', 'exit']:
-            if verbose: print('Quitting.')
+            log.debug("Quitting.")
             self.destroy()
         else:
             self.G.prompt_exe(entered_text)
             received_text = self.G.gets()
-            if verbose: print("Not quitting.")
+            log.debug("Not quitting.")
             #print(received_text)
             self._print_text(received_text)
 
@@ -81,11 +82,10 @@ class GUI_Holder(tk.Tk):
         return None
 
     def _enter_text(self, event, entered_text = None):
-        if verbose: print("## Entering enter text. ##")
+        log.debug("Entering enter text.")
         if entered_text == None: 
             entered_text = self.Entry.get()
-        if verbose: print("entered_text = {0}".format(entered_text))
-        if verbose: print("Entry.get() = {0}".format(self.Entry.get()))
+        log.debug("entered_text = %s", entered_text)
         self._wipe_entry()
         self._call_game(entered_text)  
 
@@ -96,11 +96,11 @@ class GUI_Holder(tk.Tk):
         self._enter_text(tk.Event(), 'inv')
 
     def _wipe_entry(self):
-        if verbose: print("Wiping entry.")
+        log.debug("Wiping entry.")
         self.Entry.delete("0", tk.END)
 
     def _wipe_display(self):
-        if verbose: print("Wiping display.")
+        log.debug("Wiping display.")
         self.TextDisplay.delete("0.0", tk.END)
     
 if __name__ == "__main__":
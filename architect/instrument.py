@@ -0,0 +1,79 @@
+""" instrument.py
+        Opt-in timing of the stages of a command.
+
+        A Game with instruments set (Game.instrument) records how long each
+    stage of every command takes: tokenizing, actionParse, _itemNametoItem,
+    Action.call, each Blueprint instruction, gets and _room_update. Games
+    without instruments skip all of it at the cost of one attribute test
+    per stage. Several games may share one Instruments to aggregate.
+"""
+
+import time
+
+from collections import defaultdict
+
+class Histogram:
+    """ Durations in power-of-two nanosecond buckets. """
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * 64
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max: self.max = seconds
+        self.buckets[min(int(seconds * 1e9).bit_length(), 63)] += 1
+
+    def percentile(self, q):
+        """ Upper bound, in seconds, of the bucket holding quantile q. """
+        rank, seen = q * self.count, 0
+        for n, x in enumerate(self.buckets):
+            seen += x
+            if x and seen >= rank: return min((1 << n) / 1e9, self.max)
+        return self.max
+
+    def stats(self):
+        us = lambda x: round(x * 1e6, 3)
+        return {"count": self.count,
+                "mean_us": us(self.total / self.count) if self.count else 0,
+                "p50_us": us(self.percentile(0.5)),
+                "p99_us": us(self.percentile(0.99)),
+                "max_us": us(self.max)}
+
+class Instruments:
+    """ Counters and histograms by name.
+
+        callback, if given, is called with (name, seconds) for every
+        duration recorded, e.g. to forward them to a metrics system. """
+    def __init__(self, callback = None):
+        self.callback = callback
+        self.counters = defaultdict(int)
+        self.histograms = defaultdict(Histogram)
+
+    def count(self, name, n = 1):
+        self.counters[name] += n
+
+    def record(self, name, seconds):
+        self.histograms[name].add(seconds)
+        if self.callback is not None: self.callback(name, seconds)
+
+    def time(self, name, fn, *args):
+        """ Returns fn(*args), recording how long it took under name. """
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def stats(self):
+        return {"counters": dict(self.counters),
+                "histograms": {k: v.stats()
+                               for k, v in sorted(self.histograms.items())}}
+
+    def reset(self):
+        self.counters.clear()
+        self.histograms.clear()
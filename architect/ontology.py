@@ -4,32 +4,215 @@
 
 __author__ = "David Vaillant"
 
+import logging
+import re
+import sys
+
 from collections import OrderedDict as OrdDict
+from heapq import merge
 
-verbose = False
+log = logging.getLogger(__name__)
 careful = False
 
+# Words of a player's command; punctuation between them is dropped.
+WORD = re.compile(r"[^\s,.;:!?]+")
+
+def tokenize(text):
+    """ Lower-case words of text, as the Parser reads commands. """
+    return WORD.findall(text.lower())
+
+def shared(text):
+    """ Interns strings so that equal names and descriptions are stored
+        once per world instead of once per object. """
+    return sys.intern(text) if type(text) is str else text
+
+class NameIndex():
+    """ Maps normalized Item names and nicknames to the Items using them.
+
+        Kept by each container so that name lookups don't have to scan
+        everything the container holds. """
+    def __init__(self, items = ()):
+        self.table = {}
+        for x in items: self.add(x)
+
+    @staticmethod
+    def normalize(name):
+        return ' '.join(name.lower().split())
+
+    @staticmethod
+    def keys(item):
+        """ The names item can be referred to by. """
+        N = NameIndex.normalize
+        names = (getattr(item, "name", None), getattr(item, "nickname", None))
+        return {N(x) for x in names if isinstance(x, str)}
+
+    # Most names belong to a single Item, which is stored as is; only
+    # shared names get a list.
+    def add(self, item, keys = None):
+        T = self.table
+        for k in (self.keys(item) if keys is None else keys):
+            bucket = T.get(k)
+            if bucket is None: T[k] = item
+            elif type(bucket) is list: bucket.append(item)
+            else: T[k] = [bucket, item]
+
+    def remove(self, item, keys = None):
+        T = self.table
+        for k in (self.keys(item) if keys is None else keys):
+            bucket = T.get(k)
+            if type(bucket) is list:
+                if item in bucket: bucket.remove(item)
+                if len(bucket) == 1: T[k] = bucket[0]
+            elif bucket is not None and bucket == item:
+                del T[k]
+
+    def rename(self, item, old_keys):
+        """ Refiles item after its name or nickname changed. """
+        count = min(self.get(k).count(item) for k in old_keys) \
+                if old_keys else 0
+        for _ in range(count):
+            self.remove(item, old_keys)
+            self.add(item)
+
+    def get(self, name):
+        """ Returns the Items called name. """
+        bucket = self.table.get(self.normalize(name))
+        if bucket is None: return ()
+        return tuple(bucket) if type(bucket) is list else (bucket,)
+
+class PropertyRegistry():
+    """ Gives every property name its own bit.
+
+        Items store their properties as an int mask of these bits, so a
+        set of property tests becomes a couple of integer operations. """
+    def __init__(self):
+        self.bits = {}
+        self.sets = {}
+
+    def bit(self, name):
+        """ The bit of a property name, giving it one if it has none. """
+        try:
+            return self.bits[name]
+        except KeyError:
+            b = self.bits[shared(name)] = 1 << len(self.bits)
+            return b
+
+    def lookup(self, name):
+        """ The bit of a property name, or 0 if nothing has it; unlike
+            bit, testing for unknown names doesn't use up bits. """
+        return self.bits.get(name, 0)
+
+    def mask(self, names):
+        out = 0
+        for x in names: out |= self.bit(x)
+        return out
+
+    def names(self, mask):
+        """ The (shared) frozenset of property names in mask. """
+        try:
+            return self.sets[mask]
+        except KeyError:
+            out = self.sets[mask] = frozenset(x for x, b in self.bits.items()
+                                                if mask & b)
+            return out
+
+    @staticmethod
+    def split(mask):
+        """ Yields the single bits set in mask. """
+        while mask:
+            low = mask & -mask
+            yield low
+            mask ^= low
+
+class Bag(dict):
+    """ One of an Inventory's bags: an insertion-ordered set of Items,
+        each mapped to the weight it was added with.
+
+        Adding and removing keep the Inventory's item -> bag index, name
+        index and the bag's weight total up to date. """
+    __slots__ = ('inventory', 'name', 'weight')
+
+    def __init__(self, inventory, name, items = ()):
+        super().__init__()
+        self.inventory, self.name, self.weight = inventory, name, 0
+        for x in items: self.add(x)
+
+    def add(self, item):
+        """ Puts item in this bag, taking it out of any other first. """
+        I = self.inventory
+        held = I.index.get(item)
+        if held == self.name: return
+        if held is not None: I.holding[held].remove(item)
+        self[item] = w = weigh(item)
+        self.weight += w
+        I.index[item] = self.name
+        I.names.add(item)
+
+    def remove(self, item):
+        self.weight -= self.pop(item)
+        del self.inventory.index[item]
+        self.inventory.names.remove(item)
+
+    def discard(self, item):
+        if item in self: self.remove(item)
+
+    def __repr__(self):
+        return "Bag({!r}, {})".format(self.name, list(self))
+
+class Bags(OrdDict):
+    """ An Inventory's bags by name. Whatever is assigned to a name (sets,
+        lists, ...) becomes a Bag, so the Inventory's indexes hold. """
+    def __init__(self, inventory, contents = ()):
+        super().__init__()
+        self.inventory = inventory
+        for name, items in dict(contents).items(): self[name] = items
+
+    def __setitem__(self, name, items):
+        old = self.get(name)
+        if old is not None:
+            for x in list(old): old.remove(x)
+        bag = Bag(self.inventory, name)
+        super().__setitem__(name, bag)
+        for x in items: bag.add(x)
+
+def weigh(item):
+    """ An Item's weight as a number; weights set from text are parsed. """
+    try:
+        return float(item.weight or 0)
+    except (TypeError, ValueError):
+        return 0
+
 class Inventory():
     """ Keeps track of items in player's possession.
-    
-    Implements weight as well. Eventually... """
+
+        Every held Item is indexed by the bag holding it, and each bag
+    keeps the total weight of its contents, so membership, finding and
+    capacity checks don't look through the bags. """
 
     def __init__(self, contents = None, limits = None):
         """ Allows for a non-empty initial inventory. """
-        if contents is None:
-            self.holding = OrdDict({"main":set()})
-        else:
-            self.holding = contents
+        # Copied; the same meta data may start several games.
+        self.holding = contents if contents is not None else {"main": ()}
 
         if limits is None:
             self.capacities = {x:-1 for x in self.holding}
         else:
             self.capacities = limits
-        
-        #self.updateHoldingList()
-        
+
         self.name = "Generic Inventory"
- 
+
+    @property
+    def holding(self):
+        return self._holding
+
+    @holding.setter
+    def holding(self, contents):
+        """ Replacing the bags rebuilds the indexes. """
+        # Held Item: name of its bag.
+        self.index = {}
+        self.names = NameIndex()
+        self._holding = Bags(self, contents)
+
     def __getitem__(self, bag_name):
         try:
             return self.holding[bag_name]
@@ -38,94 +221,105 @@ class Inventory():
 
     def __contains__(self, item):
         """ Defines items being "in" Inventory instances. """
-        return any(item in bag for bag in self.holding.values())
-    
+        return item in self.index
+
     def __bool__(self):
         """ Returns True if something is being held. """
-        #for x in self.holding.values():
-        #    if bool(x): return True
-        #else: return False
-        return any(self.holding.values())
-        
-    def _canHold(self, bag, item):
-        if self.capacities[bag] < 0: return True 
+        return bool(self.index)
 
-        return self.capacities[bag] >= item.weight
+    def __len__(self):
+        return len(self.index)
 
-    '''
-    def updateHoldingList(self):
-        """ 'Flattens' holding into a cached sum of held items. """
-        self.holding_list = []
-        for x in self.holding.values():
-            if verbose:
-                print(x)
-                print(self.holding_list)
-            self.holding_list.extend(list(x))
-   '''
+    def _canHold(self, bag, item):
+        """ True if bag has room left for item's weight. """
+        capacity = self.capacities.get(bag, -1)
+        if capacity < 0: return True
+        return self.holding[bag].weight + weigh(item) <= capacity
+
+    def canHold(self, item):
+        """ True if some bag has room for item. """
+        return self.bagFor(item) is not None
+
+    def bagFor(self, item):
+        """ The first bag with room for item, or None. """
+        for bag_name in self.holding:
+            if self._canHold(bag_name, item): return bag_name
+        return None
 
     def add(self, x, target = None):
-        """ Adds items to holding[target]. """
-        ## TODO: Implement weight.
+        """ Adds items to holding[target], or to the first bag with room.
+
+            Returns 0 on success, -1 if no bag (or not target) has room.
+            Items already held stay where they are. """
+        if x in self.index: return 0
         if target is None:
-            for bag_name, bag in self.holding.items():
-                if self._canHold(bag_name, x): 
-                    target = bag_name
-                    break
+            target = self.bagFor(x)
+            if target is None: return -1
+        bag = self[target]
+        if not self._canHold(target, x): return -1
+        bag.add(x)
+        return 0
 
-        try:
-            self[target].add(x)
-            return 0
-        except KeyError:
-            if target is None:
-                return -1
-            else:
-                raise KeyError("Tried to add to a non-existent bag, {}.".format(bag_name))
-        
     def remove(self, x, target="main"):
         """ Used to remove items from the inventory. """
-        ## TODO: Implement weight.
         if target is None:
             target = self.find(x)
         if target:
             try:
                 self[target].remove(x)
-                #self.updateHoldingList()
             except KeyError:
-                print("WARNING: Something went wrong.")
+                log.warning("%s is not in bag %s.", x, target)
         return
-        
+
     def find(self, x):
         """ If x is in a bag, returns the bag. Otherwise, returns None. """
-        for bag_name, bag in self.holding:
-            if x in bag: return bag_name
-        return None
-        
+        return self.index.get(x)
+
+    def weight(self, bag = None):
+        """ Total weight held, in one bag or in all of them. """
+        if bag is not None: return self.holding[bag].weight
+        return sum(x.weight for x in self.holding.values())
+
     def __iter__(self):
         for bag in self.holding.values():
             for item in bag:
                 yield item
 
     def __str__(self):
+        return ''.join(self.write([]))
+
+    def write(self, out, current = None):
+        """ Appends the listing of what's held to out, piece by piece.
+
+            current, if given, swaps a list of held Items for the versions
+            to show (see Game._current). """
+        C = current or list
         if not self:
-            return "You are not holding anything."
+            out.append("You are not holding anything.")
         elif len(self.holding) == 1:
-            out_str = 'You are holding:\n'
-            for x in self.holding_list:
-                out_str += '\t' + x.name + '\n'
+            out.append('You are holding:\n')
+            for x in C(self):
+                out.append('\t' + x.name + '\n')
         else:
-            out_str = "Inventory contents:\n"
+            out.append("Inventory contents:\n")
             for bag_name, bag in self.holding.items():
-                out_str += '\t' + bag_name + '\n'
+                out.append('\t' + bag_name + '\n')
                 if bag:
-                    for x in bag: out_str += '\t\t' + x.name + '\n'
+                    for x in C(bag): out.append('\t\t' + x.name + '\n')
                 else:
-                    out_str += '\t\t' + "Empty!\n"
-        return out_str
+                    out.append('\t\t' + "Empty!\n")
+        return out
 
 class Item():
     """ Class used to represent items or props.
         ITEMS: Can be placed in player inventory and used from there.
         PROPS: Cannot be moved from their position in a room. """
+    __slots__ = ('id', 'name', 'nickname', 'mask', 'weight',
+                 'examine_desc', 'ground_desc', 'on_acquire')
+
+    # Property bits are shared by every world in the process.
+    registry = PropertyRegistry()
+    STATIC = registry.bit("static")
         
     codes = {
         'id':'id',
@@ -141,33 +335,68 @@ class Item():
 
     def __init__(self, itemD):
         """ Populates attributes using a Item info dictionary. """
-        self.id = itemD.get("id")
-        self.name = itemD.get("name")
+        self.id = shared(itemD.get("id"))
+        self.name = shared(itemD.get("name"))
         
-        self.nickname = itemD.get("nick") or itemD.get("name", "item")
+        self.nickname = shared(itemD.get("nick") or itemD.get("name", "item"))
 
-        self.properties = set(itemD.get('property', {}))
+        self.mask = self.registry.mask(itemD.get('property', {}))
         self.weight = itemD.get("weight", 0)
-        self.isProp = ("static" in self.properties)  
 
-        self.examine_desc = itemD.get("examine", '')
-        self.ground_desc = itemD.get("ground", '')
+        self.examine_desc = shared(itemD.get("examine", ''))
+        self.ground_desc = shared(itemD.get("ground", ''))
 
         # BP code to be run when an Item is picked up
         # Probably better to make this into an Event.
-        self.on_acquire = itemD.get("acquire", "pass")
+        self.on_acquire = shared(itemD.get("acquire", "pass"))
+
+    # Items are identified by ID, so a session's copy of an Item (see
+    # utils.Overlay) stands for the shared original.
+    def __eq__(self, other):
+        if not isinstance(other, Item): return NotImplemented
+        return self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def state(self):
+        """ The mutable attributes, as plain values (see Game.snapshot). """
+        return [self.name, self.nickname, sorted(self.properties),
+                self.weight, self.examine_desc, self.ground_desc,
+                self.on_acquire]
+
+    def setState(self, state):
+        (self.name, self.nickname, properties, self.weight,
+         self.examine_desc, self.ground_desc, self.on_acquire) = state
+        self.mask = self.registry.mask(properties)
+
+    def copy(self):
+        new = Item.__new__(Item)
+        for x in Item.__slots__: setattr(new, x, getattr(self, x))
+        return new
+
+    @property
+    def properties(self):
+        return self.registry.names(self.mask)
+
+    @property
+    def isProp(self):
+        return bool(self.mask & self.STATIC)
+
+    def hasProperty(self, property_input):
+        return bool(self.mask & self.registry.lookup(property_input))
 
     def setProperty(self, property_input, isAdding = True):
         """ Adds or removes a property from an Item. """
         if isAdding:
-            self.properties.add(property_input)
+            self.mask |= self.registry.bit(property_input)
+            return False
+        b = self.registry.lookup(property_input)
+        if self.mask & b:
+            self.mask &= ~b
             return False
         else:
-            try:
-                self.properties.remove(property_input)
-                return False
-            except KeyError:
-                return True
+            return True
 
     def setDescription(self, type, text = ""):
         """ Changes type_desc attribute to specified text. """
@@ -180,77 +409,277 @@ class Item():
     ### NOTE: This could probably be moved elsewhere. ###
     ### Related: __str__ method for Items. ###
     @staticmethod
-    def item_printer(holds):
-        out_str = ''
-        if holds:
-            for x in holds:
-                if x.ground_desc == 'pass':
-                    pass
-                elif x.ground_desc == 'default':
-                    out_str = out_str + "\nThere is a " + x.name + " here."
-                else:
-                    out_str = out_str + "\n" + x.ground_desc
-            return out_str
-        else: return ''    
+    def item_printer(holds, out = None):
+        """ The ground descriptions of holds, each on a new line. Appended
+            to out piece by piece if it's given, else returned joined. """
+        chunks = [] if out is None else out
+        for x in holds or ():
+            if x.ground_desc == 'pass':
+                pass
+            elif x.ground_desc == 'default':
+                chunks.append("\nThere is a " + x.name + " here.")
+            else:
+                chunks.append("\n" + x.ground_desc)
+        return ''.join(chunks) if out is None else out
+
+class Holding():
+    """ The Items in a Room, in the order they were put down.
+
+        Membership, adding and removing are O(1). A second copy of an
+        Item is counted rather than stored again, and is listed next to
+        the first. Each Item also gets a position key; putting an Item
+        back with its old key (see Game._insert) restores its place. """
+    __slots__ = ('counts', 'keys', 'size', 'last')
+
+    def __init__(self, items = ()):
+        self.counts = {}
+        self.keys = {}
+        self.size = 0
+        self.last = 0
+        for x in items: self.append(x)
+
+    def append(self, item):
+        n = self.counts.get(item)
+        if n is None:
+            self.last += 1
+            self.counts[item], self.keys[item] = 1, self.last
+        else:
+            self.counts[item] = n + 1
+        self.size += 1
+
+    def insert(self, key, item):
+        """ Adds item at the place a position key stands for. """
+        if item in self.counts or key is None or key > self.last:
+            return self.append(item)
+        order = list(self.keys.items())
+        order.append((item, key))
+        order.sort(key = lambda x: x[1])
+        counts = self.counts
+        self.counts = {x: counts.get(x, 1) for x, _ in order}
+        self.keys = dict(order)
+        self.size += 1
+
+    def remove(self, item):
+        n = self.counts.get(item)
+        if n is None:
+            raise ValueError("{} is not held.".format(item))
+        if n == 1:
+            del self.counts[item]
+            del self.keys[item]
+        else:
+            self.counts[item] = n - 1
+        self.size -= 1
+
+    def count(self, item):
+        return self.counts.get(item, 0)
+
+    def position(self, item):
+        """ The position key of a held Item, or None. """
+        return self.keys.get(item)
+
+    def copy(self):
+        new = Holding.__new__(Holding)
+        new.counts, new.keys = dict(self.counts), dict(self.keys)
+        new.size, new.last = self.size, self.last
+        return new
+
+    def __contains__(self, item):
+        return item in self.counts
+
+    def __iter__(self):
+        for x, n in self.counts.items():
+            yield x
+            for _ in range(n - 1): yield x
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.size > 0
+
+    def __getitem__(self, index):
+        return list(self)[index]
+
+    def __eq__(self, other):
+        if not isinstance(other, (Holding, list, tuple)): return NotImplemented
+        return list(self) == list(other)
+
+    __hash__ = None
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __repr__(self):
+        return "Holding({!r})".format(list(self))
 
 class Room():
-    """ Room class. """
+    """ Room class.
+
+        links holds the cardinal exits, [W, S, N, E]; any others (up,
+        down, in, out, or whatever a world names them) go in the exits
+        dict, which stays None for Rooms with none. """
+    __slots__ = ('id', 'links', 'exits', 'name', '_entry_desc', '_holding',
+                 'names', 'is_visited', 'version')
+
     codes = {
         'id':'id',
         'name':'name',
         'desc':'entry_desc',
         'hold':'holding',
-        'links':'links'
+        'links':'links',
+        'exits':'exits'
             }
+
+    # The way back through each exit, for Euclidean links. Exits with no
+    # opposite (portals and the like) are one-way.
+    opposite = {0: 3, 1: 2, 2: 1, 3: 0,
+                'up': 'down', 'down': 'up', 'in': 'out', 'out': 'in'}
         
     def __init__(self, roomD):
-        self.id = roomD.get("id") 
+        self.id = shared(roomD.get("id"))
+        # Bumped whenever what the Room renders as changes.
+        self.version = 0
 
         self.links = roomD.get("links", [None,None,None,None])
-        self.name = roomD.get("name", '')
+        self.exits = roomD.get("exits") or None
+        self.name = shared(roomD.get("name", ''))
         
         _ = roomD.get("desc")
         # Used to catch lazy setting single-line descriptions
         # as strings instead of singleton lists.
-        self.entry_desc = [_] if isinstance(_, str) else (_ or 
-                                                          ["This is a room."])
+        _ = [_] if isinstance(_, str) else (_ or ["This is a room."])
+        self.entry_desc = tuple(shared(x) for x in _)
            
-        self.holding = roomD.get("hold", [])
+        _ = roomD.get("hold", [])
         # Used to catch setting holding to a string instead of a list.
-        if isinstance(self.holding, str): 
-            self.holding = [self.holding]
+        self.holding = [_] if isinstance(_, str) else _
 
         ##if d('data'): self.data = []
 
         self.is_visited = False
         
+    @property
+    def holding(self):
+        return self._holding
+
+    @holding.setter
+    def holding(self, items):
+        """ Replacing the holding list rebuilds the name index. """
+        if not isinstance(items, Holding): items = Holding(items)
+        self._holding = items
+        self.names = NameIndex(items)
+        self.version += 1
+
+    @property
+    def entry_desc(self):
+        return self._entry_desc
+
+    @entry_desc.setter
+    def entry_desc(self, desc):
+        self._entry_desc = desc
+        self.version += 1
+
+    def __eq__(self, other):
+        if not isinstance(other, Room): return NotImplemented
+        return self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def state(self):
+        """ The mutable attributes, as plain values (see Game.snapshot). """
+        I = lambda x: x.id if x is not None else None
+        return [self.name, list(self.entry_desc),
+                [I(x) for x in self.links], [x.id for x in self.holding],
+                {d: x.id for d, x in self.exits.items()} if self.exits
+                                                         else None]
+
+    def setState(self, state, rooms, items):
+        """ Inverse of state(); rooms and items turn IDs back into objects. """
+        self.name, entry_desc, links, holding, exits = state
+        self.entry_desc = tuple(shared(x) for x in entry_desc)
+        self.links = [rooms(x) if x else None for x in links]
+        self.holding = [items(x) for x in holding]
+        self.exits = {d: rooms(x) for d, x in exits.items()} if exits \
+                                                               else None
+
+    def copy(self):
+        new = Room.__new__(Room)
+        new.id, new.name = self.id, self.name
+        new.version = self.version
+        new.entry_desc, new.is_visited = self.entry_desc, self.is_visited
+        new.links = list(self.links)
+        new.exits = dict(self.exits) if self.exits else None
+        new.holding = self.holding.copy()
+        return new
+
     def __contains__(self, item):
         """ Simplifies 'in' calls. """
         return item in self.holding
             
     def add(self, item):
         self.holding.append(item)
+        self.names.add(item)
+        self.version += 1
+
+    def insert(self, key, item):
+        """ Adds item back at a Holding position key. """
+        self.holding.insert(key, item)
+        self.names.add(item)
+        self.version += 1
         
     def remove(self, item):
         self.holding.remove(item)
+        self.names.remove(item)
+        self.version += 1
         
+    def withProperty(self, property):
+        """ Returns the held Items which have property. """
+        b = Item.registry.lookup(property)
+        return [x for x in self.holding if x.mask & b]
+
+    def describe(self):
+        """ The entry description as one string. """
+        return "\n".join(self.entry_desc)
+
     def onEntry(self):
         """ Runs whenever a room is entered. """
         self.is_visited = True
-        out = "\n".join(self.entry_desc)
-        return out
+        return self.describe()
  
+    def exit(self, dir):
+        """ The Room an exit leads to, or None. dir is a links index or
+            the name of another exit. """
+        if dir.__class__ is int: return self.links[dir]
+        return self.exits.get(dir) if self.exits else None
+
+    def setExit(self, dir, room):
+        """ Points an exit at room; None removes it. """
+        if dir.__class__ is int:
+            self.links[dir] = room
+        elif room is not None:
+            if self.exits is None: self.exits = {}
+            self.exits[dir] = room
+        elif self.exits:
+            self.exits.pop(dir, None)
+
+    def allExits(self):
+        """ (direction, Room) for every exit that leads somewhere. """
+        for d, x in enumerate(self.links):
+            if x is not None: yield d, x
+        if self.exits: yield from self.exits.items()
+
     def link(self, linked_room, dir, isEuclidean = True):
         if isEuclidean and self == linked_room:
             raise TypeError("Euclidean rooms enabled; no loops allowed.")
 
-        self.links[dir] = linked_room
+        self.setExit(dir, linked_room)
         if isEuclidean:
-            if dir == 0: dir = 3
-            elif dir == 1: dir = 2
-            elif dir == 2: dir = 1
-            elif dir == 3: dir = 0
-            linked_room.links[dir] = self
+            back = self.opposite.get(dir)
+            if back is not None: linked_room.setExit(back, self)
  
     def __str__(self):  
         string = ("Name: {0}\n"
@@ -271,7 +700,132 @@ class Room():
         
         return string  
 
+class Lazy:
+    """ Mixin for stand-ins that build themselves from a raw record.
+
+        A stub only knows its id until some other attribute is asked for;
+        it then runs its class's __init__ on the record, followed by the
+        hydrator (which resolves links and the like), and answers. """
+    def __init__(self, id, record, hydrator = None):
+        self.id = id
+        self._record = record
+        self._hydrator = hydrator
+
+    def __getattr__(self, attr):
+        d = self.__dict__
+        if '_record' not in d:
+            raise AttributeError(attr)
+        record, hydrator = d.pop('_record'), d.pop('_hydrator')
+        super(Lazy, self).__init__(record)
+        if hydrator is not None: hydrator(self)
+        return getattr(self, attr)
+
+    def isHydrated(self):
+        return '_record' not in self.__dict__
+
+class LazyRoom(Lazy, Room):
+    pass
+
+class LazyItem(Lazy, Item):
+    pass
+
+class Condition:
+    """ A pre-parsed Action condition.
+
+        Conditions are written [~]item_id or [~]p:property; the empty
+        condition is always true. """
+    def __init__(self, text):
+        self.text = text
+        self.negated = (text[:1] == '~')
+
+        body = text[1:] if self.negated else text
+        if body[:2] == 'p:':
+            self.property, self.id = body[2:], None
+            # Registered, not looked up: Items may gain it after this.
+            self.bit = Item.registry.bit(self.property)
+        else:
+            self.property, self.id = None, body
+            self.bit = 0
+        self.isEmpty = (text == '')
+
+    def test(self, item):
+        """ Tests if item fulfills the condition. """
+        if self.isEmpty: return True
+
+        if self.property is not None:
+            val = bool(item.mask & self.bit)
+        else:
+            val = (self.id == item.id)
+        return val != self.negated
+
+class Clause:
+    """ &-joined Conditions compiled into a single test.
+
+        Property conditions fold into a required and a forbidden mask;
+        item ID conditions into one required ID and a set of excluded
+        ones. """
+    def __init__(self, conditions):
+        self.conditions = tuple(conditions)
+        self.required = self.forbidden = 0
+        ids, self.not_ids = set(), set()
+
+        for x in self.conditions:
+            if x.isEmpty: continue
+            if x.property is not None:
+                if x.negated: self.forbidden |= x.bit
+                else: self.required |= x.bit
+            else:
+                (self.not_ids if x.negated else ids).add(x.id)
+
+        self.id = ids.pop() if len(ids) == 1 else None
+        self.impossible = len(ids) > 1 or \
+                          bool(self.required & self.forbidden) or \
+                          self.id in self.not_ids
+
+    def test(self, item):
+        """ Tests if item fulfills every condition. """
+        m = item.mask
+        return (m & self.required) == self.required and \
+               not (m & self.forbidden) and \
+               (self.id is None or self.id == item.id) and \
+               not (self.not_ids and item.id in self.not_ids) and \
+               not self.impossible
+
+class BranchIndex:
+    """ Finds the first branch an Item satisfies without testing them all.
+
+        Each branch is filed under one condition it requires: an item ID,
+        a property bit, or neither. Only branches filed under something
+        item has are candidates, and they are tested in their original
+        order. Branches which can never match are left out. """
+    def __init__(self, clauses):
+        self.by_id = {}
+        self.by_bit = {}
+        self.bits = 0
+        self.generic = []
+
+        for n, clause in enumerate(clauses):
+            if clause.impossible: continue
+            if clause.id is not None:
+                self.by_id.setdefault(clause.id, []).append(n)
+            elif clause.required:
+                low = clause.required & -clause.required
+                self.by_bit.setdefault(low, []).append(n)
+                self.bits |= low
+            else:
+                self.generic.append(n)
+
+    def candidates(self, item):
+        """ Yields, in order, the indices of the branches item might fit. """
+        lists = [self.by_id.get(item.id, ()), self.generic]
+        lists.extend(self.by_bit[b] for b in
+                     PropertyRegistry.split(item.mask & self.bits))
+        return merge(*lists)
+
 class Action:
+    # Actions with more branches than this get a BranchIndex.
+    INDEX_THRESHOLD = 16
+
     codes = {
         "id":   "id",
         "zero": "zero_act",
@@ -287,10 +841,42 @@ class Action:
         self.unary_act = self.unaryHelper(actionD.get("one", {'':"pass"}))
         self.binary_act = self.binaryHelper(actionD.get("two", {'|':"pass"}))
         self.binary_prep = actionD.get("prep", "")
+        self.prep_words = tokenize(self.binary_prep)
 
         self.min, self.max = self.min_maxHelper()
         self.isKnown = actionD.get("isKnown", True)
 
+        # Conditions compiled once, as (Clause, branch key) pairs.
+        P = lambda k: Clause(Condition(x) for x in k)
+        self.unary_branches = [(P(k), k) for k in self.unary_act]
+        self.binary_branches = [((P(i), P(j)), (i, j))
+                                for i, j in self.binary_act]
+
+        self.unary_index = self.binary_index = None
+        if len(self.unary_branches) > self.INDEX_THRESHOLD:
+            self.unary_index = BranchIndex(
+                    [k for k, _ in self.unary_branches])
+        if len(self.binary_branches) > self.INDEX_THRESHOLD:
+            self.binary_index = BranchIndex(
+                    [k[0] for k, _ in self.binary_branches])
+
+        # Instruction lists mirroring the *_act tables; see compile().
+        self.zero_code = None
+        self.unary_code = None
+        self.binary_code = None
+
+    def compile(self, compiler):
+        """ Builds instruction lists for every Blueprint branch.
+
+            compiler takes a line of BP code and returns an instruction,
+            or None for lines that do nothing ('pass'). """
+        C = lambda bp: [_ for _ in map(compiler, bp) if _ is not None]
+
+        self.zero_code = C(self.zero_act)
+        self.unary_code = OrdDict((k, C(v)) for k, v in self.unary_act.items())
+        self.binary_code = OrdDict((k, C(v))
+                                   for k, v in self.binary_act.items())
+
     def unaryHelper(self, act_list):
         """ Takes a list of lists of length 2, produces an OrderedDict. """
         K = lambda x: tuple(x.split('&'))
@@ -335,49 +921,52 @@ class Action:
     @staticmethod
     def unaryTest(item, condition):
         """ Tests if item fulfills the given condition. """
-        if verbose: print("Testing condition: {}".format(condition))
+        log.debug("Testing condition: %s", condition)
+        return Condition(condition).test(item)
     
-        # Skip evaluation if empty condition is given.
-        if condition == '': return True
+    @staticmethod
+    def pluralUnaryTest(single_obj, condition_array):
+        return Clause(Condition(x) for x in condition_array).test(single_obj)
 
-        is_negated = (condition[0] == '~')
-        if is_negated: condition = condition[1:] 
+    def call(self, input_objs, compiled = False):
+        """ Takes either an Item or a tuple or Items, returns BP code.
 
-        if condition[:2] == 'p:':
-            val = (condition[2:] in item.properties)
+            With compiled set, returns the instruction list built by
+            compile() instead. """
+        if compiled:
+            zero, unary, binary = (self.zero_code, self.unary_code,
+                                   self.binary_code)
         else:
-            val = (condition == item.id)
-        return (not val) if is_negated else val
-    
-    @staticmethod
-    def pluralUnaryTest(single_obj, condition_array):
-        for x in condition_array:
-            if Action.unaryTest(single_obj, x): continue 
-            else: return False
-        return True
+            zero, unary, binary = (self.zero_act, self.unary_act,
+                                   self.binary_act)
 
-    def call(self, input_objs):
-        """ Takes either an Item or a tuple or Items, returns BP code. """
         val = None
         if input_objs == 0:
-            val = self.zero_act
+            val = zero
 
         elif(len(input_objs) == 2):
-            for (i,j),bp in self.binary_act.items():
-                if self.pluralUnaryTest(input_objs[0], i) and \
-                   self.pluralUnaryTest(input_objs[1], j):
-                        val = bp 
-                        break
-                else: continue
+            first, second = input_objs
+            B = self.binary_branches
+            order = self.binary_index.candidates(first) \
+                    if self.binary_index else range(len(B))
+            for n in order:
+                (i,j), key = B[n]
+                if i.test(first) and j.test(second):
+                    val = binary[key]
+                    break
 
         else: # Only one object.
-            for i,bp in self.unary_act.items():
-                if self.pluralUnaryTest(input_objs[0], i):
-                    val = bp 
+            U = self.unary_branches
+            order = self.unary_index.candidates(input_objs[0]) \
+                    if self.unary_index else range(len(U))
+            for n in order:
+                i, key = U[n]
+                if i.test(input_objs[0]):
+                    val = unary[key]
                     break
-                else: continue
 
-        if verbose: print("Returning {}.".format(val))
+        log.debug("Returning %s.", val)
+        if compiled: return val or []
         return val or 'pass'
 
 class Actor:
@@ -0,0 +1,103 @@
+""" replay.py
+        Replays transcripts against one world across a process pool.
+
+        Each worker process loads the world once into a base Game and plays
+    every transcript it is given in a fresh Game.session over it. Used for
+    regression runs (keep the outputs and compare them) and load tests
+    (commands per second).
+
+    A transcript is a file with one command per line (see Game.replay) or
+    a list of commands.
+
+    Usage:
+        python -m architect.replay [--world WORLD] [-j N] TRANSCRIPT...
+"""
+
+import multiprocessing
+import os
+import time
+
+from architect.game import Game
+from architect.utils import JSON_Reader
+from architect.worldfile import World_Reader
+
+DEFAULT_WORLD = "resource_files/desc_test.json"
+
+# The worker's world, set up by _startWorker.
+_base = None
+_mdata = None
+
+def load(world):
+    """ Reads a JSON or compiled (.arcw) world file for Game. """
+    if world.endswith(".arcw"): return World_Reader(world).output()
+    return JSON_Reader(world).output()
+
+def _startWorker(world):
+    global _base, _mdata
+    data = load(world)
+    _base, _mdata = Game(*data), data[3]
+
+def _play(job):
+    """ Plays one transcript.
+
+        Returns (commands, seconds, outputs, error); a command that raises
+        ends its transcript and is reported as the error. """
+    transcript, keep = job
+    G = Game.session(_base, _mdata)
+    outputs, error = [], None
+    start = time.perf_counter()
+    try:
+        if isinstance(transcript, str):
+            outputs.extend(G.replayFile(transcript))
+        else:
+            outputs.extend(G.replay(transcript))
+    except Exception as e:
+        error = repr(e)
+    seconds = time.perf_counter() - start
+    # The opening text isn't a command; the one that raised is.
+    count = max(len(outputs) - 1, 0) + (error is not None)
+    return count, seconds, outputs if keep else None, error
+
+def replayMany(transcripts, world = DEFAULT_WORLD, processes = None,
+               keep_output = False, chunksize = 8):
+    """ Replays transcripts over a pool of processes.
+
+        Returns the totals and commands per second of wall time, the
+        errors that ended transcripts early (by position) and, with
+        keep_output, each transcript's outputs in order. """
+    jobs = [(x, keep_output) for x in transcripts]
+    # A world that fails in the pool's initializer makes it respawn
+    # workers forever, so the world is checked here first, by the path
+    # the workers will use.
+    world = os.path.abspath(world)
+    if world.endswith(".arcw"): World_Reader(world).close()
+    else: load(world)
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes, _startWorker, (world,)) as P:
+        results = P.map(_play, jobs, chunksize)
+    wall = time.perf_counter() - start
+
+    commands = sum(x[0] for x in results)
+    report = {"transcripts": len(jobs),
+              "commands": commands,
+              "seconds": round(wall, 4),
+              "busy_seconds": round(sum(x[1] for x in results), 4),
+              "commands_per_second": round(commands / wall, 1)}
+    errors = {n: x[3] for n, x in enumerate(results) if x[3] is not None}
+    if errors: report["errors"] = errors
+    if keep_output: report["outputs"] = [x[2] for x in results]
+    return report
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    P = argparse.ArgumentParser(description="Replay Architect transcripts.")
+    P.add_argument("transcripts", nargs="+")
+    P.add_argument("--world", default=DEFAULT_WORLD)
+    P.add_argument("-j", "--processes", type=int, default=None)
+    P.add_argument("-n", "--repeat", type=int, default=1,
+                   help="play every transcript this many times")
+    args = P.parse_args()
+
+    print(json.dumps(replayMany(args.transcripts * args.repeat, args.world,
+                                args.processes), indent=2))
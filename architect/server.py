@@ -0,0 +1,146 @@
+""" server.py
+        Hosts many concurrent Game sessions over one shared world.
+
+        The world is read and built once (JSON_Reader or World_Reader)
+    into a base Game that is never played; each session is a copy-on-write
+    Game.session over it, holding only what that player changed. Clients
+    talk a line protocol: each line
+    sent is a command, and each reply is the game's output followed by a
+    "> " prompt. "#stats" replies with the session's own latency figures.
+
+    Usage:
+        python -m architect.server [--port N | --unix PATH] [WORLD]
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import time
+
+from collections import deque
+
+from architect.game import Game
+from architect.utils import JSON_Reader
+
+log = logging.getLogger(__name__)
+
+PROMPT = "> "
+QUIT = {"q", "quit", "exit"}
+FAILED = "Something went wrong, so that command was undone.\n"
+
+class Session:
+    """ One player's Game plus timing figures for its commands. """
+    def __init__(self, id, game, window = 1000):
+        self.id = id
+        self.game = game
+        self.commands = 0
+        self.latencies = deque(maxlen=window)
+
+    def start(self):
+        self.game.main()
+        return self.game.gets()
+
+    def execute(self, line):
+        """ Runs a command and returns the output it produced.
+
+            A command that raises is logged and whatever it changed is
+            undone, so the session carries on from before it. """
+        G = self.game
+        start = time.perf_counter()
+        last = G.journal[-1] if G.journal else None
+        try:
+            G.prompt_exe(line)
+            out = G.gets()
+        except Exception:
+            log.exception("Session %s failed on %r.", self.id, line)
+            # prompt_exe journals a failed command's changes as a step.
+            if G.journal and G.journal[-1] is not last: G.rollback()
+            G.output.clear()
+            out = FAILED
+        self.latencies.append(time.perf_counter() - start)
+        self.commands += 1
+        return out
+
+    def stats(self):
+        """ Latency figures in milliseconds over the recent window. """
+        L = sorted(self.latencies)
+        if not L: return {"commands": 0}
+        ms = lambda x: round(x * 1000, 3)
+        pick = lambda q: L[min(len(L) - 1, int(q * len(L)))]
+        return {"commands": self.commands,
+                "mean_ms": ms(sum(L) / len(L)),
+                "p50_ms": ms(pick(0.5)),
+                "p99_ms": ms(pick(0.99)),
+                "max_ms": ms(L[-1])}
+
+class Game_Server:
+    """ Accepts connections and gives each one its own Session. """
+    def __init__(self, reader = None):
+        self.world = (reader or JSON_Reader()).output()
+        self.base = Game(*self.world)
+        self.sessions = {}
+        self._ids = itertools.count(1)
+
+    def newGame(self):
+        return Game.session(self.base, self.world[3])
+
+    def stats(self):
+        return {sid: S.stats() for sid, S in self.sessions.items()}
+
+    async def handle(self, reader, writer):
+        S = Session(next(self._ids), self.newGame())
+        self.sessions[S.id] = S
+        try:
+            writer.write((S.start() + PROMPT).encode())
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line: break
+                line = line.decode(errors="replace").strip()
+
+                if line.lower() in QUIT:
+                    writer.write((Game.GAME_MSGS["quit"] + "\n").encode())
+                    break
+                elif line == "#stats":
+                    out = json.dumps(S.stats()) + "\n"
+                else:
+                    out = S.execute(line)
+                writer.write((out + PROMPT).encode())
+                # Gives the other sessions their turn.
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            del self.sessions[S.id]
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def start(self, host = "127.0.0.1", port = 0, path = None):
+        """ Starts listening on TCP, or on a Unix socket if path is set. """
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path=path)
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def serve(self, **kwargs):
+        server = await self.start(**kwargs)
+        async with server:
+            await server.serve_forever()
+
+if __name__ == "__main__":
+    import argparse
+    P = argparse.ArgumentParser(description="Serve an Architect world.")
+    P.add_argument("world", nargs="?", default="resource_files/desc_test.json")
+    P.add_argument("--host", default="127.0.0.1")
+    P.add_argument("--port", type=int, default=4000)
+    P.add_argument("--unix", help="listen on a Unix socket instead")
+    args = P.parse_args()
+
+    server = Game_Server(JSON_Reader(args.world))
+    if args.unix:
+        asyncio.run(server.serve(path=args.unix))
+    else:
+        asyncio.run(server.serve(host=args.host, port=args.port))
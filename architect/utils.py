@@ -1,11 +1,78 @@
 import json
+import logging
+import logging.handlers
+import queue
 import re
+import time
 
-from collections import OrderedDict as OrdDict
-from pyparsing import oneOf, Optional, Literal
-from pyparsing import StringEnd, Or, Empty, SkipTo, ParseException 
+try:
+    import resource
+except ImportError:     # Not available on Windows.
+    resource = None
+
+try:
+    import ijson        # Optional, faster streaming backend.
+except ImportError:
+    ijson = None
+
+from collections import OrderedDict as OrdDict, deque
+
+from architect.ontology import NameIndex, Lazy, tokenize
+
+class PhraseIndex:
+    """ Finds the longest known phrase (an Item name or nickname) starting
+        at a given word.
+
+        Phrases are stored in a trie keyed by the words Parser.tokenize
+        finds, so a match reads each word once and stops at the first one
+        no phrase goes on with. The phrase's END holds its name as
+        NameIndex normalizes it, punctuation and all, for lookups. """
+    END = ''
+
+    def __init__(self, phrases = ()):
+        self.root = {}
+        for x in phrases: self.add(x)
+
+    def add(self, phrase):
+        if not isinstance(phrase, str): return
+        node = self.root
+        for w in Parser.tokenize(phrase): node = node.setdefault(w, {})
+        if node is not self.root:
+            node.setdefault(self.END, NameIndex.normalize(phrase))
+
+    def match(self, words, at = 0):
+        """ The index just past the longest phrase at words[at] and the
+            phrase's normalized name; (None, None) if there's none. """
+        node, end, name = self.root, None, None
+        for n in range(at, len(words)):
+            node = node.get(words[n])
+            if node is None: break
+            if self.END in node: end, name = n + 1, node[self.END]
+        return end, name
 
 class Parser:
+    # Blueprint calling syntax is CMD!ARGS. Each command splits its ARGS
+    # on its own separator symbols; see resource_files/blueprint_lib.txt.
+    BP_SYNTAX = {
+        'puts':           r'(.*)',
+        'link':           r'(\w+)-(\w+)->(\w+)',
+        'add':            r'(\w+)@(\w+)(?:\.(\w+))?',
+        'remove':         r'(\w+)@(\w+)(?:\.(\w+))?',
+        'move':           r'(\w+)@(\w+)->(\w+)',
+        'changeItem':     r'(\w+)\.(\w+)=(.*)',
+        'changeRoom':     r'(\w+)\.(\w+)=(.*)',
+        'changeInv':      r'(\w+)\.(\w+)=(.*)',
+        'addProperty':    r'(\w+)#(.*)',
+        'removeProperty': r'(\w+)#(.*)',
+        }
+    BP_SYNTAX = {k:re.compile(v, re.S) for k, v in BP_SYNTAX.items()}
+
+    # Older CMD(ARGS) form, arguments separated by commas.
+    BP_FUNCTION = re.compile("(\w+)" + "\(" + "([A-Za-z0-9, ]+)" + "\)")
+
+    # Skipped before an Item's name, unless they start one.
+    ARTICLES = {'the', 'a', 'an'}
+
     def __init__(self, r, i, a, b):
         """ Takes information from Game class to initialize parsing. """
 
@@ -18,6 +85,51 @@ class Parser:
                             'changeRoom', 'changeItem', 'changeInventory',
                             'addProperty', 'removeProperty',
                            ]
+
+        # The PhraseIndex of Item names actionParse matches against.
+        # vocabChanged() throws it away.
+        self._item_grammar = None
+
+    def vocabChanged(self):
+        """ Invalidates the Item name index after an Item name or
+            nickname changes. """
+        self._item_grammar = None
+
+    tokenize = staticmethod(tokenize)
+
+    def _itemGrammar(self):
+        """ Returns the PhraseIndex of every Item name and nickname. """
+        if self._item_grammar is None:
+            self._item_grammar = PhraseIndex(self._itemNames())
+        return self._item_grammar
+
+    def _itemNames(self):
+        """ Every Item name and nickname. Lazy games' Items that haven't
+            been built are read from their records instead. """
+        items = self.items
+        if type(items) is not Registry:
+            for x in items.values():
+                yield x.name
+                yield x.nickname
+            return
+        for iden in items:
+            x = dict.get(items, iden)
+            if x is None or isinstance(x, Lazy) and not x.isHydrated():
+                record = items.records[iden]
+                yield record.get("name")
+                yield record.get("nick") or record.get("name", "item")
+            else:
+                yield x.name
+                yield x.nickname
+
+    def _itemPhrase(self, words, at):
+        """ The Item name at words[at], after any article, and the index
+            past it; (None, at) if there isn't one. """
+        end, name = self._itemGrammar().match(words, at)
+        if end is None and at < len(words) and words[at] in self.ARTICLES:
+            end, name = self._item_grammar.match(words, at + 1)
+        if end is None: return None, at
+        return name, end
         
     def bpParse(self, code):
         """ Given a line of BP code, parses out the command and parameters. 
@@ -59,40 +171,37 @@ class Parser:
         """
         
         # Finds the first instance of !; used to divide CMD from PARAMS.
-        argumentRegex = "([A-Za-z0-9, ]+)"
-        functionRegex = "(\w+)" + "\(" + argumentRegex + "\)"
-        _ = re.search(functionRegex, code)
-        command = _.group(1)
-        parameters = [x.strip() for x in _.group(2).split(',')]
+        command, bang, rest = code.partition('!')
+        if bang:
+            try:
+                _ = self.BP_SYNTAX[command].fullmatch(rest)
+            except KeyError:
+                raise KeyError("Attempted to call the %s command."%command)
+            if _ is None:
+                raise SyntaxError("Malformed Blueprint: {}".format(code))
+            parameters = [x for x in _.groups() if x is not None]
+        else:
+            _ = self.BP_FUNCTION.search(code)
+            command = _.group(1)
+            parameters = [x.strip() for x in _.group(2).split(',')]
         
-        """
-        try:
-            return command, pt[command].parseString(parameters)[::2]
-        except KeyError:
-            raise KeyError("Attempted to call the %s command."%command)
-        """
         return command, parameters
         
     def actionParse(self, Act, parameters):
         """ Parses arity and item IDs from a user action command. """
-        item_names_list = [_.name for _ in self.items.values()] +\
-               [_.nickname for _ in self.items.values()]
-        item = oneOf(' '.join(item_names_list))
-        
-        zero = Empty()
-        first = item
-        second = Literal(Act.binary_prep) + item if Act.binary_prep\
-              else Empty()
-        
         out = None 
         if parameters:
             if Act.max > 0:
-                if Act.min == 2: _ = first + second
-                else: _ = first + Optional(second)
-                
-                try:
-                    out = _.parseString(parameters).asList()[::2]
-                except ParseException:
+                prep = Act.prep_words
+                words = self.tokenize(parameters)
+
+                # Item [prep Item]; words after that are ignored.
+                first, at = self._itemPhrase(words, 0)
+                out = [first] if first is not None else []
+                if out and prep and words[at:at+len(prep)] == prep:
+                    second, _ = self._itemPhrase(words, at + len(prep))
+                    if second is not None: out.append(second)
+                if not out or len(out) < Act.min:
                     out = "$! Input < Min"
             else:
                 out = "$! Input > Max"
@@ -103,27 +212,247 @@ class Parser:
             else: out = "$! 0 < Min"
         return out 
 
+class Registry(dict):
+    """ A dict which builds its values from raw records on first lookup.
+
+        Iteration and membership cover every record, loaded or not;
+        values() and items() load everything, loaded() doesn't. """
+    def __init__(self, records, factory):
+        super().__init__()
+        self.records = records
+        self.factory = factory
+
+    def __missing__(self, key):
+        obj = self[key] = self.factory(key, self.records[key])
+        return obj
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self.records
+
+    def __iter__(self):
+        yield from self.records
+        for key in dict.__iter__(self):
+            if key not in self.records: yield key
+
+    def __len__(self):
+        return len(self.records) + sum(1 for key in dict.__iter__(self)
+                                       if key not in self.records)
+
+    def get(self, key, default = None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def loaded(self):
+        """ The values built so far. """
+        return list(dict.values(self))
+
+class Overlay(Registry):
+    """ A copy-on-write view of a shared mapping of Rooms or Items.
+
+        Lookups fall through to the base; writable() copies a value into
+        the overlay the first time it is about to change, so the overlay
+        only ever holds what its owner changed. """
+    def __init__(self, base):
+        super().__init__(base, None)
+        self.base = base
+
+    def __missing__(self, key):
+        return self.base[key]
+
+    def writable(self, key):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        obj = self[key] = self.base[key].copy()
+        return obj
+
 class JSON_Reader:
-    def __init__(self, filename = "resource_files/desc_test.json"):
+    def __init__(self, filename = "resource_files/desc_test.json",
+                       streaming = False):
+        """ Reads a world file.
+
+            With streaming set, records are read one at a time and turned
+            into Rooms, Items and Actions straight away, so the whole file
+            is never held in memory as raw dicts. Game accepts either, but
+            streamed objects belong to the first Game built from them. """
         self.f = filename
+        self.streaming = streaming
 
         self.action_info = {}
         self.item_info = {}
         self.room_info = {}
         self.meta_info = {}
+
+        # Load time and peak RSS of the last main() call.
+        self.stats = {}
         
         self.main()
 
     def main(self):
-        with open(self.f, 'r') as F:
-            p = json.load(F, object_pairs_hook=OrdDict)
-        
-        for x in p:
-            getattr(self, x["type"]+"_info").update({x["id"]:x})
+        start = time.perf_counter()
+        if self.streaming:
+            self._build(self.stream())
+        else:
+            with open(self.f, 'r') as F:
+                p = json.load(F, object_pairs_hook=OrdDict)
+            for x in p:
+                getattr(self, x["type"]+"_info").update({x["id"]:x})
+
+        self.stats = {"seconds": time.perf_counter() - start,
+                      "peak_rss_kb": peak_rss()}
         return
+
+    def _build(self, records):
+        """ Dispatches records on their type, constructing objects. """
+        # Imported here; ontology doesn't depend on utils but game does.
+        from architect.ontology import Room, Item, Action
+        classes = {"room": Room, "item": Item, "action": Action}
+
+        for x in records:
+            kind = x["type"]
+            obj = classes[kind](x) if kind in classes else x
+            getattr(self, kind+"_info")[x["id"]] = obj
+
+    def stream(self, chunk_size = 1 << 16):
+        """ Yields the elements of the file's top-level array one by one. """
+        return self.records(self.f, chunk_size)
+
+    @staticmethod
+    def records(filename, chunk_size = 1 << 16):
+        """ As stream(), for any file. """
+        if ijson is not None:
+            # ijson reads bytes; given text it warns and re-encodes it.
+            with open(filename, 'rb') as F:
+                yield from ijson.items(F, 'item', map_type=OrdDict)
+            return
+
+        with open(filename, 'r') as F:
+            decoder = json.JSONDecoder(object_pairs_hook=OrdDict)
+            buf, pos, eof = '', 0, False
+            ws = re.compile(r'[\s,]*')
+
+            def more():
+                nonlocal buf, pos, eof
+                chunk = F.read(chunk_size)
+                if not chunk: eof = True
+                buf, pos = buf[pos:] + chunk, 0
+
+            more()
+            pos = ws.match(buf, pos).end()
+            if buf[pos:pos+1] != '[':
+                raise ValueError("{} is not a JSON array.".format(filename))
+            pos += 1
+
+            while True:
+                pos = ws.match(buf, pos).end()
+                if pos == len(buf):
+                    if eof:
+                        raise ValueError("Unterminated array in "
+                                         "{}.".format(filename))
+                    more()
+                    continue
+                if buf[pos] == ']': return
+
+                try:
+                    x, end = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    x, end = None, None
+                # An element touching the end of the buffer may be cut off.
+                if end is None or (end == len(buf) and not eof):
+                    if eof:
+                        raise ValueError("Malformed record in "
+                                         "{}.".format(filename))
+                    more()
+                    continue
+                pos = end
+                yield x
         
     def output(self):
         return (self.room_info, self.item_info, 
                 self.action_info, self.meta_info)
 
 
+class Output_Buffer:
+    """ Game output waiting to be read.
+
+        Kept as a list of chunks, so adding to it never copies what's
+        already there; joined only when read as a whole. """
+    def __init__(self):
+        self.chunks = deque()
+
+    def append(self, text):
+        self.chunks.append(text)
+
+    def extend(self, texts):
+        self.chunks.extend(texts)
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    def getvalue(self):
+        return ''.join(self.chunks)
+
+    def clear(self):
+        self.chunks.clear()
+
+    def drain(self):
+        """ Yields and removes the chunks in order, including any added
+            while the consumer is busy with the previous one. """
+        C = self.chunks
+        while C: yield C.popleft()
+
+class Log_Queue(logging.handlers.QueueListener):
+    """ Hands a logger's records to handlers on a background thread, so
+        games never wait on log I/O. Use it as a context manager, or
+        start() and stop() it; stopping flushes what's still queued. """
+    def __init__(self, *handlers, logger = "architect"):
+        super().__init__(queue.SimpleQueue(), *handlers,
+                         respect_handler_level=True)
+        self.logger = logging.getLogger(logger)
+        self.handler = logging.handlers.QueueHandler(self.queue)
+
+    def start(self):
+        self.logger.addHandler(self.handler)
+        super().start()
+
+    def stop(self):
+        self.logger.removeHandler(self.handler)
+        super().stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def peak_rss():
+    """ Peak resident set size of this process in KiB, if known. """
+    if resource is None: return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+if __name__ == "__main__":
+    # Reports startup cost of a world file, e.g.
+    #   python -m architect.utils world.json --stream
+    # Run each loader in its own process; peak RSS never goes down.
+    import sys
+    from architect.game import Game
+
+    args = sys.argv[1:]
+    streaming = "--stream" in args
+    args = [x for x in args if x != "--stream"]
+
+    start = time.perf_counter()
+    F = JSON_Reader(*args[:1], streaming = streaming)
+    G = Game(*F.output())
+    print("loader:      {}".format("streaming" if streaming else "json.load"))
+    print("read:        {:.3f} s".format(F.stats["seconds"]))
+    print("startup:     {:.3f} s".format(time.perf_counter() - start))
+    print("peak RSS:    {} KiB".format(peak_rss()))
@@ -0,0 +1,285 @@
+""" worldfile.py
+        Compiled world files for Architect.
+
+        A world file holds the same records as a JSON world but in a
+    binary layout that can be mmap'ed and read record by record, so many
+    game processes can share one page-cached copy instead of each parsing
+    JSON into its own.
+
+    Layout (little-endian):
+        header      magic, version, string count, record count,
+                    string table offset, index offset
+        records     tagged values, one per record
+        strings     offset table followed by UTF-8 data; every string
+                    (ids, names, descriptions, keys) is stored once
+        index       (type, id string, record offset), sorted by type
+                    then id, for binary search
+
+    Usage:
+        python -m architect.worldfile world.json world.arcw
+        G = Game(*World_Reader("world.arcw").output())
+"""
+
+import mmap
+import struct
+
+from collections import OrderedDict as OrdDict
+from collections.abc import Mapping
+
+from architect.utils import JSON_Reader
+
+MAGIC = b'ARCW'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHHIIQQ')
+INDEX_ENTRY = struct.Struct('<BxxxIQ')
+U32 = struct.Struct('<I')
+U64 = struct.Struct('<Q')
+I64 = struct.Struct('<q')
+F64 = struct.Struct('<d')
+
+TYPES = ["room", "item", "action", "meta"]
+
+class Encoder:
+    """ Appends values to a bytearray as tagged records.
+
+        Strings go through putString, which writes them inline; the world
+        file writes string table indices instead. Everything else is laid
+        out the same way in both. """
+    def value(self, x, out):
+        """ Appends the tagged encoding of x to out. """
+        if x is None:
+            out += b'N'
+        elif x is True:
+            out += b'T'
+        elif x is False:
+            out += b'F'
+        elif isinstance(x, int):
+            out += b'i' + I64.pack(x)
+        elif isinstance(x, float):
+            out += b'f' + F64.pack(x)
+        elif isinstance(x, str):
+            out += b's'
+            self.putString(x, out)
+        elif isinstance(x, (list, tuple)):
+            out += b'l' + U32.pack(len(x))
+            for y in x: self.value(y, out)
+        elif isinstance(x, dict):
+            out += b'd' + U32.pack(len(x))
+            for k, y in x.items():
+                self.putString(k, out)
+                self.value(y, out)
+        else:
+            raise TypeError("Can't encode {!r}.".format(x))
+        return out
+
+    def putString(self, s, out):
+        b = s.encode('utf-8')
+        out += U32.pack(len(b)) + b
+
+class Decoder:
+    """ Reads values written by an Encoder with the same string layout. """
+    def __init__(self, data):
+        self.data = data
+
+    def value(self, at):
+        """ Decodes the value at an offset; returns it and the next offset. """
+        D = self.data
+        tag = D[at:at+1]
+        at += 1
+        if tag == b'N': return None, at
+        if tag == b'T': return True, at
+        if tag == b'F': return False, at
+        if tag == b'i': return I64.unpack_from(D, at)[0], at + 8
+        if tag == b'f': return F64.unpack_from(D, at)[0], at + 8
+        if tag == b's': return self.getString(at)
+        if tag == b'l':
+            count = U32.unpack_from(D, at)[0]
+            at += 4
+            out = []
+            for _ in range(count):
+                x, at = self.value(at)
+                out.append(x)
+            return out, at
+        if tag == b'd':
+            count = U32.unpack_from(D, at)[0]
+            at += 4
+            out = OrdDict()
+            for _ in range(count):
+                k, at = self.getString(at)
+                out[k], at = self.value(at)
+            return out, at
+        raise ValueError("Corrupt value at offset {}.".format(at - 1))
+
+    def getString(self, at):
+        """ Reads a string; returns it and the next offset. """
+        n = U32.unpack_from(self.data, at)[0]
+        return bytes(self.data[at+4:at+4+n]).decode('utf-8'), at + 4 + n
+
+def pack(x, out = None):
+    """ Encodes a value with its strings inline. Used for small standalone
+        blobs such as Game snapshots. """
+    return Encoder().value(x, bytearray() if out is None else out)
+
+def unpack(data, at = 0):
+    """ Decodes a value written by pack(); returns it and the next offset. """
+    return Decoder(data).value(at)
+
+class World_Writer(Encoder):
+    """ Encodes world records into the compiled layout. """
+    def __init__(self):
+        self.strings = {}
+        self.records = bytearray()
+        self.index = []
+
+    def string(self, s):
+        """ Returns the string table index of s, adding it if needed. """
+        try:
+            return self.strings[s]
+        except KeyError:
+            n = self.strings[s] = len(self.strings)
+            return n
+
+    def putString(self, s, out):
+        out += U32.pack(self.string(s))
+
+    def add(self, record):
+        """ Adds one record, which needs a known "type" and an "id". """
+        try:
+            kind = TYPES.index(record["type"])
+        except ValueError:
+            raise ValueError("Unknown record type {}.".format(record["type"]))
+        self.index.append((kind, record["id"], len(self.records)))
+        self.value(record, self.records)
+
+    def write(self, filename):
+        strings = [s.encode('utf-8') for s in self.strings]
+        string_offsets = bytearray()
+        position = 0
+        for s in strings:
+            string_offsets += U64.pack(position)
+            position += len(s)
+        string_offsets += U64.pack(position)
+
+        records_at = HEADER.size
+        strings_at = records_at + len(self.records)
+        index_at = strings_at + len(string_offsets) + position
+
+        self.index.sort(key = lambda x: (x[0], x[1].encode('utf-8')))
+        with open(filename, 'wb') as F:
+            F.write(HEADER.pack(MAGIC, VERSION, 0, len(strings),
+                                len(self.index), strings_at, index_at))
+            F.write(self.records)
+            F.write(string_offsets)
+            for s in strings: F.write(s)
+            for kind, iden, offset in self.index:
+                F.write(INDEX_ENTRY.pack(kind, self.string(iden),
+                                         records_at + offset))
+
+    @classmethod
+    def compile(cls, json_file, filename):
+        """ Converts a JSON world file into a compiled one. """
+        W = cls()
+        for record in JSON_Reader.records(json_file):
+            W.add(record)
+        W.write(filename)
+        return W
+
+class World_Reader(Decoder):
+    """ Reads a compiled world file through mmap. """
+    def __init__(self, filename):
+        self.f = filename
+        self._file = open(filename, 'rb')
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, _, self.n_strings, self.n_records,
+         self.strings_at, self.index_at) = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            if magic != MAGIC:
+                raise ValueError("{} is not a world file.".format(filename))
+            raise ValueError("{} is version {}; expected {}.".format(
+                                                filename, version, VERSION))
+        self.text_at = self.strings_at + (self.n_strings + 1) * U64.size
+
+        # Meta data is small and gets edited (isCLI, ...), so it's a dict.
+        self.meta_info = {k: dict(v) for k, v in self.view("meta").items()}
+
+    def close(self):
+        self.data.close()
+        self._file.close()
+
+    def string(self, n):
+        at = self.strings_at + n * U64.size
+        start, end = struct.unpack_from('<QQ', self.data, at)
+        return self.data[self.text_at+start:self.text_at+end].decode('utf-8')
+
+    def _entry(self, n):
+        return INDEX_ENTRY.unpack_from(self.data,
+                                       self.index_at + n * INDEX_ENTRY.size)
+
+    def _search(self, kind, iden = None):
+        """ Index of the first entry >= (kind, iden); binary search. """
+        key = (kind, iden.encode('utf-8') if iden is not None else b'')
+        lo, hi = 0, self.n_records
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k, s, _ = self._entry(mid)
+            if (k, self.string(s).encode('utf-8')) < key: lo = mid + 1
+            else: hi = mid
+        return lo
+
+    def span(self, type):
+        """ Index entry range [start, stop) holding records of a type. """
+        kind = TYPES.index(type)
+        return self._search(kind), self._search(kind + 1)
+
+    def ids(self, type):
+        start, stop = self.span(type)
+        for n in range(start, stop):
+            yield self.string(self._entry(n)[1])
+
+    def record(self, type, iden):
+        """ Decodes the record of a type with the given id. """
+        kind = TYPES.index(type)
+        n = self._search(kind, iden)
+        if n < self.n_records:
+            k, s, offset = self._entry(n)
+            if k == kind and self.string(s) == iden:
+                return self.value(offset)[0]
+        raise KeyError(iden)
+
+    def getString(self, at):
+        return self.string(U32.unpack_from(self.data, at)[0]), at + 4
+
+    def view(self, type):
+        return Record_View(self, type)
+
+    def output(self):
+        """ Same shape as JSON_Reader.output(), for Game. """
+        return (self.view("room"), self.view("item"),
+                self.view("action"), self.meta_info)
+
+class Record_View(Mapping):
+    """ Read-only id -> record mapping over one type of record. """
+    def __init__(self, reader, type):
+        self.reader = reader
+        self.type = type
+
+    def __getitem__(self, iden):
+        return self.reader.record(self.type, iden)
+
+    def __iter__(self):
+        return self.reader.ids(self.type)
+
+    def __len__(self):
+        start, stop = self.reader.span(self.type)
+        return stop - start
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 3:
+        print("usage: python -m architect.worldfile WORLD.json OUT.arcw")
+        sys.exit(2)
+    W = World_Writer.compile(*sys.argv[1:])
+    print("{} records, {} strings.".format(len(W.index), len(W.strings)))
@@ -0,0 +1,42 @@
+""" memory.py
+        Measures the memory held by Rooms and Items in a synthetic world.
+
+        python -m benchmarks.memory [ROOMS] [ITEMS_PER_ROOM]
+
+    Reports bytes per Item and per Room (including resolved links,
+    holdings and name indexes), as traced by tracemalloc. """
+
+import sys
+import tracemalloc
+
+from architect.game import Game
+from architect.ontology import Room, Item
+from benchmarks.worldgen import generate, split
+
+def measure(build):
+    """ Returns build()'s result and the bytes it left allocated. """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    out = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return out, after - before
+
+def main(rooms = 2000, items_per_room = 20):
+    rdata, idata, adata, mdata = split(generate(rooms, items_per_room))
+
+    items, item_bytes = measure(lambda: {k: Item(v) for k, v in idata.items()})
+    # Rooms are counted once built and populated by Game.
+    build = lambda: Game({k: Room(v) for k, v in rdata.items()},
+                         items, adata, mdata)
+    G, room_bytes = measure(build)
+
+    results = {"rooms": len(G.rooms), "items": len(items),
+               "bytes_per_item": item_bytes / len(items),
+               "bytes_per_room": room_bytes / len(G.rooms)}
+    for k, v in results.items():
+        print("{:16} {:.0f}".format(k, v))
+    return results
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:3]])
@@ -0,0 +1,127 @@
+""" pipeline.py
+        Times each stage of the command pipeline on a synthetic world.
+
+        python -m benchmarks.pipeline [--rooms N] [--items N] ... [-o FILE]
+
+    Measures loading (JSON_Reader, Game.__init__, _populate), prompt_exe
+    for each kind of command, Action.call and gets. Figures are written
+    as JSON, with the world's parameters and the Python version, so runs
+    can be compared across releases. """
+
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from architect.game import Game
+from architect.utils import JSON_Reader
+from benchmarks.worldgen import generate, write
+
+def summary(times):
+    """ Timing figures, in microseconds, of a list of durations. """
+    times = sorted(times)
+    us = lambda x: round(x * 1e6, 2)
+    pick = lambda q: times[min(len(times) - 1, int(q * len(times)))]
+    return {"runs": len(times), "mean_us": us(sum(times) / len(times)),
+            "p50_us": us(pick(0.5)), "p99_us": us(pick(0.99)),
+            "min_us": us(times[0])}
+
+def timed(fn, repeat, reset = None):
+    """ Times fn over repeat runs; reset runs untimed after each. """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+        if reset is not None: reset()
+    return summary(times)
+
+def command(G, line, repeat, undo = False):
+    """ Times prompt_exe(line). Output is cleared between runs and, with
+        undo, whatever the command changed is rolled back. """
+    def reset():
+        G.output.clear()
+        if undo: G.rollback()
+    return timed(lambda: G.prompt_exe(line), repeat, reset)
+
+def target(G):
+    """ An Item in the player's room whose name no other Item there has. """
+    for x in G.loc.holding:
+        if len(G.loc.names.get(x.name)) == 1 and not x.isProp:
+            return x
+    raise ValueError("No uniquely named Item in the initial room.")
+
+def run(world, repeat = 1000, loads = 5):
+    """ Benchmarks every stage on a list of world records. """
+    results = {}
+    def bench(name, fn):
+        try:
+            results[name] = fn()
+        except Exception as e:
+            results[name] = {"error": repr(e)}
+
+    with tempfile.TemporaryDirectory() as D:
+        path = os.path.join(D, "world.json")
+        write(world, path)
+        bench("json_load", lambda: timed(lambda: JSON_Reader(path), loads))
+        data = JSON_Reader(path).output()
+
+    bench("game_init", lambda: timed(lambda: Game(*data), loads))
+    G = Game(*data)
+    bench("populate", lambda: timed(G._populate, loads))
+
+    for iden in [x for x in G.items if x.startswith("held_")]:
+        G._add(iden, '_')
+    G.journal.clear()
+    item = target(G)
+    action = G.actions.get("act_0")
+
+    bench("movement", lambda: command(G, "s", repeat, undo=True))
+    bench("inventory", lambda: command(G, "i", repeat))
+    bench("take", lambda: command(G, "take " + item.name, repeat, undo=True))
+    if action is not None:
+        bench("user_action",
+              lambda: command(G, "act_0 " + item.name, repeat))
+        bench("action_call", lambda: timed(
+              lambda: action.call([item], compiled=True), repeat))
+    bench("gets", lambda: timed(G.gets, repeat))
+    return results
+
+def main(argv = None):
+    import argparse
+    P = argparse.ArgumentParser(description="Benchmark the command pipeline.")
+    P.add_argument("--rooms", type=int, default=400)
+    P.add_argument("--items", type=int, default=10,
+                   help="items per room")
+    P.add_argument("--inventory", type=int, default=10)
+    P.add_argument("--actions", type=int, default=4)
+    P.add_argument("--branches", type=int, default=8)
+    P.add_argument("--vocabulary", type=int, default=8)
+    P.add_argument("--repeat", type=int, default=1000)
+    P.add_argument("--loads", type=int, default=5)
+    P.add_argument("-o", "--output", default="benchmark_results.json")
+    args = P.parse_args(argv)
+
+    params = {k: getattr(args, k) for k in
+              ("rooms", "items", "inventory", "actions", "branches",
+               "vocabulary", "repeat", "loads")}
+    world = generate(args.rooms, args.items, inventory=args.inventory,
+                     actions=args.actions, branches=args.branches,
+                     vocabulary=args.vocabulary)
+    report = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": sys.version.split()[0],
+              "platform": platform.platform(),
+              "params": params,
+              "results": run(world, args.repeat, args.loads)}
+
+    with open(args.output, 'w') as F:
+        json.dump(report, F, indent=2)
+    for name, figures in report["results"].items():
+        print("{:12} {}".format(name, figures.get("mean_us",
+                                                  figures.get("error"))))
+    return report
+
+if __name__ == "__main__":
+    main()
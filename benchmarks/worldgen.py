@@ -0,0 +1,82 @@
+""" worldgen.py
+        Synthetic world generator for benchmarks.
+
+        Builds the same list of records a JSON world file holds, so the
+    output can be fed to Game directly (via split()) or written out with
+    json.dump for the loaders. """
+
+import json
+import random
+
+NOUNS = ["key", "box", "coin", "book", "stone", "lamp", "rope", "jar"]
+ADJECTIVES = ["red", "blue", "old", "small", "heavy", "shiny", "worn"]
+
+def nouns(vocabulary):
+    """ vocabulary distinct nouns; extra ones are numbered. """
+    return [NOUNS[n % len(NOUNS)] + (str(n // len(NOUNS)) if n >= len(NOUNS)
+                                     else '') for n in range(vocabulary)]
+
+def generate(rooms = 100, items_per_room = 10, properties = 8, seed = 0,
+             inventory = 0, actions = 0, branches = 4, vocabulary = 8):
+    """ Returns a list of world records.
+
+        Rooms form a grid linked W/S/N/E; the first one is "initial".
+        Items get a random name out of vocabulary nouns, a few of
+        properties random properties, and descriptions shared with
+        other items of the same kind. inventory more Items, "held_0"
+        and on, are left out of every room for the player to hold.
+        Actions "act_0" and on take one Item and have branches branches,
+        testing properties and Item IDs, plus a default one. """
+    R = random.Random(seed)
+    width = max(1, int(rooms ** 0.5))
+    room_id = lambda n: "initial" if n == 0 else "room_%d" % n
+
+    words = nouns(vocabulary)
+    props = ["prop_%d" % n for n in range(properties)]
+
+    def item(iden):
+        adj, noun = R.choice(ADJECTIVES), R.choice(words)
+        return {"type": "item", "id": iden,
+                "name": "%s %s" % (adj, noun), "nick": noun,
+                "ground": "There is a %s %s here." % (adj, noun),
+                "examine": "An unremarkable %s." % noun,
+                "property": R.sample(props, min(3, len(props)))}
+
+    records = []
+    for n in range(rooms):
+        x, y = n % width, n // width
+        neighbour = lambda m, ok: room_id(m) if ok and m < rooms else None
+        links = [neighbour(n - 1, x > 0), neighbour(n + width, True),
+                 neighbour(n - width, y > 0), neighbour(n + 1, x < width-1)]
+        hold = ["item_%d_%d" % (n, k) for k in range(items_per_room)]
+        records.append({
+            "type": "room", "id": room_id(n), "name": "Room %d" % n,
+            "desc": ["You are in room %d." % n,
+                     "It looks like every other room."],
+            "hold": hold, "links": links})
+        records.extend(item(iden) for iden in hold)
+
+    records.extend(item("held_%d" % n) for n in range(inventory))
+
+    item_ids = [x["id"] for x in records if x["type"] == "item"]
+    for n in range(actions):
+        # About half the branches test properties, the rest Item IDs.
+        keys = ["p:" + x for x in R.sample(props, min(branches // 2,
+                                                      len(props)))]
+        keys += R.sample(item_ids, min(branches - len(keys), len(item_ids)))
+        one = {k: "puts!Branch %d of action %d." % (i, n)
+               for i, k in enumerate(keys)}
+        one[""] = "puts!Nothing happens."
+        records.append({"type": "action", "id": "act_%d" % n, "one": one})
+    return records
+
+def split(records):
+    """ Sorts records into the info dicts Game takes, like JSON_Reader. """
+    info = {"room": {}, "item": {}, "action": {}, "meta": {}}
+    for x in records:
+        info[x["type"]][x["id"]] = x
+    return info["room"], info["item"], info["action"], info["meta"]
+
+def write(records, filename):
+    with open(filename, 'w') as F:
+        json.dump(records, F)
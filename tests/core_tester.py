@@ -2,6 +2,12 @@ import unittest
 from tester_ontology import *
 from tester_parser import *
 from tester_game_module import *
+from tester_worldfile import *
+from tester_server import *
+from tester_replay import *
+from tester_instrument import *
+from tester_logging import *
+from tester_graph import *
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,9 +1,9 @@
 import unittest, mock
-from collections import OrderedDict
+from collections import OrderedDict, deque
 
 from architect.game import InvalidBranchError, Game
 from architect.utils import JSON_Reader
-from architect.ontology import Room, Item, Action, Inventory
+from architect.ontology import Room, Item, Action, Inventory, NameIndex
 
 class Game_Loader(unittest.TestCase):
     """ Abstract base class that testing units inherit from. """
@@ -11,6 +11,19 @@ class Game_Loader(unittest.TestCase):
         self.Reader = JSON_Reader()
         self.Reader.main()
       
+class JSON_Reader_Tester(Game_Loader):
+    def test_records(self):
+        records = list(JSON_Reader.records(self.Reader.f))
+        self.assertIn("initial", [x["id"] for x in records])
+
+    @mock.patch("architect.utils.ijson")
+    def test_records_with_ijson(self, mock_ijson):
+        modes = []
+        mock_ijson.items.side_effect = lambda F, *args, **kwargs: \
+                                       modes.append(F.mode) or iter(())
+        list(JSON_Reader.records(self.Reader.f))
+        self.assertEqual(modes, ['rb'])
+
 class Game_Tester(Game_Loader):
     def setUp(self):
         super().setUp()
@@ -123,6 +136,49 @@ class Game_Prompt_Tester(Game_Tester):
         self.G.prompt_exe("asdfas")
         mock__puts.assert_called_with(self.G.ERROR["exe_pass"])
 
+    @mock.patch.object(Game, '_act')
+    def test_prompt_exe_prefix(self, mock__act):
+        self.G.prompt_exe("unl red door")
+        mock__act.assert_called_with(["unlock", "red", "door"])
+        self.G.prompt_exe("tak bauble")
+        mock__act.assert_called_with(["take", "bauble"])
+
+    def test_prompt_exe_take_with_article(self):
+        self.G.prompt_exe("take the blue bauble")
+        self.assertIn(self.bauble, self.G.inventory)
+
+    def test_prompt_exe_punctuated_name(self):
+        self.G._changeItem("bauble", "nick", "orb, small")
+        self.G.prompt_exe("take orb, small")
+        self.assertIn(self.bauble, self.G.inventory)
+        self.G.prompt_exe("tap the orb, small")
+        self.assertIn("Clink clink.", self.G.gets())
+
+    @mock.patch.object(Game, '_act')
+    def test_prompt_exe_actions_beat_builtins(self, mock__act):
+        rooms, items, actions, meta = self.Reader.output()
+        actions = dict(actions, look={"id": "look",
+                                      "one": {"": "puts!You peer at it."}})
+        G = Game(rooms, items, actions, meta)
+        for x in ["look bauble", "l"]:
+            G.prompt_exe(x)
+        mock__act.assert_called_once_with(["look", "bauble"])
+
+    @mock.patch.object(Game, '_puts')
+    def test_prompt_exe_ambiguous_prefix(self, mock__puts):
+        self.G.prompt_exe("ta bauble")
+        mock__puts.assert_called_with(self.G.ERROR["ambiguity"])
+
+    @mock.patch.object(Game, '_movePlayer')
+    def test_prompt_exe_aliases(self, mock__movePlayer):
+        G = Game(*self.Reader.output()[:3], {"aliases": {"gn": "go north"}})
+        G.prompt_exe("gn")
+        mock__movePlayer.assert_called_with("n")
+        self.assertIs(Game.session(G).commands, G.commands)
+        with mock.patch.object(Game, '_inv') as mock__inv:
+            G.prompt_exe("inventory")
+            mock__inv.assert_called_with("open")
+
     @mock.patch.object(Game, '_puts')
     def test_itemNametoItem(self, mock__puts):
         self.G.loc = self.G.rooms['entrance']
@@ -133,6 +189,391 @@ class Game_Prompt_Tester(Game_Tester):
         self.G._itemNametoItem('ascvas')
         mock__puts.assert_called_with(self.G.ERROR["item_not_found"])
     
+class Game_NameIndex_Tester(Game_Tester):
+    def test_index_follows_take(self):
+        self.G._specialAct("take", "bauble")
+        self.assertEqual(self.G.inventory.names.get("blue bauble"),
+                         (self.bauble,))
+        self.assertEqual(self.initial.names.get("bauble"), ())
+
+    def test_index_follows_move(self):
+        self.G._move(self.bauble, self.initial, self.basement)
+        self.assertEqual(self.basement.names.get("bauble"), (self.bauble,))
+        self.assertEqual(self.initial.names.get("bauble"), ())
+
+    def test_index_follows_changeItem(self):
+        self.G._changeItem("bauble", "nick", "marble")
+        self.assertEqual(self.G._itemNametoItem("marble"), self.bauble)
+        self.assertEqual(self.initial.names.get("bauble"), ())
+
+    def test_changeItem_refiles_only_holders(self):
+        self.G._changeItem("bauble", "nick", "marble")
+        self.G._move(self.bauble, self.initial, self.basement)
+        self.G._changeItem("bauble", "nick", "glass")
+        self.assertEqual(self.basement.names.get("glass"), (self.bauble,))
+        self.assertEqual(self.initial.names.get("glass"), ())
+        with mock.patch.object(NameIndex, 'rename') as mock_rename:
+            self.G._changeItem("bauble", "nick", "orb")
+        self.assertEqual(mock_rename.call_count, 1)
+
+    @mock.patch.object(Game, '_puts')
+    def test_index_ambiguity(self, mock__puts):
+        self.G._add("shards", "initial")
+        self.G._changeItem("shards", "nick", "bauble")
+        self.assertIsNone(self.G._itemNametoItem("bauble"))
+        mock__puts.assert_called_with(self.G.ERROR["ambiguity"])
+
+class Game_Lazy_Tester(Game_Loader):
+    def setUp(self):
+        super().setUp()
+        self.Reader.meta_info['isLazy'] = True
+        self.G = Game(*self.Reader.output())
+
+    def loaded(self, registry):
+        return {x.id for x in registry.loaded() if x.isHydrated()}
+
+    def test_lazy_startup(self):
+        self.assertTrue(self.G.is_lazy)
+        self.assertEqual(self.loaded(self.G.rooms), set())
+        self.assertEqual(len(self.G.rooms), len(self.Reader.room_info))
+
+    def test_lazy_hydration_on_movement(self):
+        self.G.main()
+        self.G.gets()
+        self.assertEqual(self.loaded(self.G.rooms), {"initial"})
+        self.assertEqual(self.loaded(self.G.items), {"bauble"})
+
+        self.G.prompt_exe("n")
+        self.assertIs(self.G.loc, self.G.rooms["entrance"])
+        self.assertIn(self.G.items["worn_key"], self.G.loc)
+        self.assertEqual(self.loaded(self.G.rooms), {"initial", "entrance"})
+
+    def test_lazy_action_parse(self):
+        self.G.main()
+        self.G.prompt_exe("tap bauble")
+        self.assertIn("Clink clink.", self.G.gets())
+        self.assertEqual(self.loaded(self.G.items), {"bauble"})
+
+    def test_lazy_rename(self):
+        self.G._changeItem("painting", "nick", "portrait")
+        self.assertNotIn("house", self.loaded(self.G.rooms))
+        house = self.G._IDtoRoom("house")
+        self.assertEqual(house.names.get("portrait"),
+                         (self.G.items["painting"],))
+
+    def test_lazy_IDtoRoom(self):
+        house = self.G._IDtoRoom("house")
+        self.assertIsInstance(house, Room)
+        self.assertIs(house.links[3], None)
+        self.assertIs(house.links[0], self.G.rooms["basement"])
+        self.assertIn(self.G.items["painting"], house)
+
+class Game_CopyOnWrite_Tester(Game_Tester):
+    def setUp(self):
+        super().setUp()
+        self.S = Game.session(self.G)
+        self.T = Game.session(self.G)
+
+    def test_session_shares_world(self):
+        self.assertIs(self.S.rooms["initial"], self.initial)
+        self.assertIs(self.S.items["bauble"], self.bauble)
+        self.assertEqual(dict.__len__(self.S.rooms), 0)
+
+    def test_session_copies_on_write(self):
+        self.S.prompt_exe("take bauble")
+        self.assertIn(self.bauble, self.S.inventory)
+        self.assertIn(self.bauble, self.initial)
+        self.assertIn(self.bauble, self.T.loc)
+        self.assertEqual(list(dict.keys(self.S.rooms)), ["initial"])
+        self.assertEqual(dict.__len__(self.S.items), 0)
+
+    def test_session_link_and_properties(self):
+        self.S.loc = self.S.rooms["entrance"]
+        self.S._move(self.key, self.S.loc, self.S.inventory)
+        self.S._act("unlock door with key".split())
+        self.assertIn("unlocked", self.S.items["old_door"].properties)
+        self.assertNotIn("unlocked", self.door.properties)
+
+        self.S.prompt_exe("n")
+        self.assertEqual(self.S.loc.id, "house")
+        self.assertIsNone(self.entrance.links[2])
+
+    def test_session_rename(self):
+        self.S._changeItem("bauble", "nick", "marble")
+        self.assertEqual(self.S._itemNametoItem("marble").nickname, "marble")
+        self.assertIsNotNone(self.T._itemNametoItem("bauble"))
+        self.assertEqual(self.bauble.nickname, "bauble")
+
+    def test_session_inventory_shows_copies(self):
+        self.S.prompt_exe("take bauble")
+        self.S._changeItem("bauble", "name", "red bauble")
+        self.S.gets()
+        self.S.prompt_exe("i")
+        self.assertIn("You are holding:\n\tred bauble\n", self.S.gets())
+
+class Game_Snapshot_Tester(Game_Tester):
+    def unlock(self, G):
+        G.loc = G.rooms["entrance"]
+        G._move("worn_key", G.loc, G.inventory)
+        G._act("unlock door with key".split())
+
+    def test_snapshot_only_saves_changes(self):
+        fresh = self.G.snapshot()
+        self.G.prompt_exe("take bauble")
+        self.G._changeItem("bauble", "nick", "marble")
+        self.assertGreater(len(self.G.snapshot()), len(fresh))
+        self.assertEqual(set(self.G.pristine),
+                         {(True, "initial"), (False, "bauble")})
+
+    def test_undo_after_restore(self):
+        saved = self.G.snapshot()
+        for x in ["take bauble", "n", "take key"]: self.G.prompt_exe(x)
+        self.G.restore(saved)
+        self.assertEqual(self.G.rollback(3), 0)
+        self.assertEqual(list(self.initial.holding), [self.bauble])
+        self.assertNotIn(self.key, self.G.inventory)
+        self.assertEqual(list(self.entrance.holding).count(self.key), 1)
+
+    def test_restore(self):
+        saved = self.G.snapshot()
+        self.G.prompt_exe("take bauble")
+        self.unlock(self.G)
+        self.G._changeItem("bauble", "nick", "marble")
+        self.G.restore(saved)
+
+        self.assertIs(self.G.loc, self.initial)
+        self.assertFalse(self.G.inventory)
+        self.assertIn(self.bauble, self.initial)
+        self.assertIsNone(self.entrance.links[2])
+        self.assertNotIn("unlocked", self.door.properties)
+        self.assertEqual(self.bauble.nickname, "bauble")
+        self.assertEqual(self.G._itemNametoItem("bauble"), self.bauble)
+        self.assertEqual(self.G.pristine, {})
+
+    def test_restore_later_state(self):
+        self.G.prompt_exe("take bauble")
+        self.unlock(self.G)
+        self.G._changeItem("worn_key", "nick", "rusty")
+        saved = self.G.snapshot()
+
+        H = Game(*self.Reader.output())
+        H.restore(saved)
+        self.assertEqual(H.loc.id, "entrance")
+        self.assertEqual({x.id for x in H.inventory},
+                         {"bauble", "worn_key"})
+        self.assertIs(H.rooms["entrance"].links[2], H.rooms["house"])
+        self.assertIn("unlocked", H.items["old_door"].properties)
+        self.assertEqual(H._itemNametoItem("rusty", "held").id, "worn_key")
+        self.assertEqual(H.snapshot(), saved)
+
+    def test_restore_session(self):
+        S = Game.session(self.G)
+        saved = S.snapshot()
+        self.unlock(S)
+        S._changeItem("bauble", "nick", "marble")
+        later = S.snapshot()
+
+        S.restore(saved)
+        self.assertEqual(dict.__len__(S.items), 0)
+        self.assertIs(S.parser, self.G.parser)
+        self.assertNotIn(self.key, S.inventory)
+
+        S.restore(later)
+        self.assertIn("unlocked", S.items["old_door"].properties)
+        self.assertNotIn("unlocked", self.door.properties)
+        self.assertEqual(S._itemNametoItem("marble", "global").id, "bauble")
+        self.assertEqual(self.bauble.nickname, "bauble")
+
+    def test_bad_snapshot(self):
+        self.assertRaises(ValueError, self.G.restore, b"ARCW\x01\x00N")
+
+class Game_Undo_Tester(Game_Tester):
+    def test_undo_take(self):
+        holding = list(self.initial.holding)
+        self.G.prompt_exe("take bauble")
+        self.G.prompt_exe("undo")
+        self.assertEqual(self.initial.holding, holding)
+        self.assertNotIn(self.bauble, self.G.inventory)
+        self.assertEqual(self.G.inventory.names.get("bauble"), ())
+        self.assertEqual(self.G.journal, deque())
+
+    def test_undo_keeps_room_order(self):
+        self.G._add("worn_key", "initial")
+        holding = list(self.initial.holding)
+        self.G.prompt_exe("take bauble")
+        self.G.prompt_exe("undo")
+        self.assertEqual(list(self.initial.holding), holding)
+
+    def test_undo_move_player(self):
+        self.G.prompt_exe("e")
+        self.G.prompt_exe("undo")
+        self.assertIs(self.G.loc, self.initial)
+
+    def test_command_inside_step(self):
+        with self.G._undoStep():
+            self.G._addProperty("bauble", "shiny")
+            self.G.prompt_exe("e")
+        self.assertEqual(len(self.G.journal), 1)
+        self.G.prompt_exe("undo")
+        self.assertIs(self.G.loc, self.initial)
+        self.assertNotIn("shiny", self.bauble.properties)
+
+    def test_undo_action(self):
+        self.G.loc = self.entrance
+        self.G._move(self.key, self.entrance, '_')
+        self.G.prompt_exe("unlock door with key")
+        self.assertEqual(len(self.G.journal), 2)
+        self.G.prompt_exe("undo")
+        self.assertNotIn("unlocked", self.door.properties)
+        self.assertIsNone(self.entrance.links[2])
+        self.assertIs(self.house.links[1], self.entrance)
+        self.assertIn(self.key, self.G.inventory)
+
+    def test_rollback(self):
+        self.G._changeItem("bauble", "nick", "marble")
+        self.G._changeRoom("initial", "name", "Start")
+        self.G._addProperty("bauble", "shiny")
+        self.G._addProperty("bauble", "shiny")
+        self.assertEqual(self.G.rollback(10), 3)
+        self.assertEqual(self.bauble.nickname, "bauble")
+        self.assertEqual(self.G._itemNametoItem("bauble"), self.bauble)
+        self.assertNotEqual(self.initial.name, "Start")
+        self.assertNotIn("shiny", self.bauble.properties)
+        self.assertEqual(self.G.rollback(), 0)
+
+    def test_journal_is_bounded(self):
+        G = Game(*self.Reader.output()[:3], {"undoLimit": 2})
+        for d in "nsn": G.prompt_exe(d)
+        self.assertEqual(len(G.journal), 2)
+
+    def test_undo_session(self):
+        S = Game.session(self.G)
+        S.prompt_exe("take bauble")
+        S.prompt_exe("undo")
+        self.assertIn(self.bauble, S.loc)
+        self.assertFalse(S.inventory)
+        self.assertIn(self.bauble, self.initial)
+
+    @mock.patch.object(Game, '_puts')
+    def test_nothing_to_undo(self, mock__puts):
+        self.G.prompt_exe("undo")
+        mock__puts.assert_called_with(Game.ERROR["undo_empty"])
+
+class Game_Replay_Tester(Game_Tester):
+    def test_replay(self):
+        out = list(self.G.replay(["take bauble", "", "# comment",
+                                  "take bauble", "q", "e"]))
+        self.assertEqual(len(out), 4)
+        self.assertIn(Game.GAME_MSGS["beginning"], out[0])
+        self.assertIn("Picked up the blue bauble.", out[1])
+        self.assertIn(Game.ERROR["act_already_holding"], out[2])
+        self.assertIs(self.G.loc, self.initial)
+
+    def test_replay_is_lazy(self):
+        out = self.G.replay(["s"], start=False)
+        self.assertIs(self.G.loc, self.initial)
+        next(out)
+        self.assertIs(self.G.loc, self.flowers)
+
+class Game_Capacity_Tester(Game_Tester):
+    def test_inventory_from_meta_data(self):
+        rooms, items, actions, meta = self.Reader.output()
+        G = Game(rooms, items, actions,
+                 dict(meta, inventory={"main": ["worn_key"]}))
+        self.assertIn(G.items["worn_key"], G.inventory)
+        self.assertEqual(G.inventory.weight(),
+                         float(G.items["worn_key"].weight or 0))
+
+    def test_capacities_from_meta_data(self):
+        rooms, items, actions, meta = self.Reader.output()
+        items = dict(items, bauble=dict(items["bauble"], weight=5))
+        G = Game(rooms, items, actions, dict(meta, capacities={"main": 4}))
+        self.assertEqual(G.inventory.capacities, {"main": 4})
+        G.prompt_exe("take bauble")
+        self.assertIn(G.ERROR["act_too_heavy"], G.gets())
+        self.assertNotIn(G.items["bauble"], G.inventory)
+
+    @mock.patch.object(Game, '_puts')
+    def test_take_too_heavy(self, mock__puts):
+        self.bauble.weight = 5
+        self.G.inventory.capacities["main"] = 4
+        self.G.prompt_exe("take bauble")
+        mock__puts.assert_called_with(Game.ERROR["act_too_heavy"])
+        self.assertIn(self.bauble, self.initial)
+
+    def test_move_into_full_inventory(self):
+        self.bauble.weight = 5
+        self.G.inventory.capacities["main"] = 4
+        self.G._move(self.bauble, self.initial, '_')
+        self.assertIn(self.bauble, self.initial)
+        self.assertNotIn(self.bauble, self.G.inventory)
+
+class Game_Render_Tester(Game_Tester):
+    def test_render_is_cached(self):
+        first = self.G.gets()
+        with mock.patch.object(Room, 'describe') as mock_describe:
+            self.G.prompt_exe("look")
+            self.assertEqual(self.G.gets(), first)
+            self.assertFalse(mock_describe.called)
+
+    def test_render_is_per_game(self):
+        H = Game(*self.Reader.output())
+        first = H.gets()
+        self.G._changeItem("bauble", "ground", "Shiny!")
+        with mock.patch.object(Room, 'describe') as mock_describe:
+            self.assertEqual(H.gets(), first)
+            self.assertFalse(mock_describe.called)
+
+    def test_session_render_leaves_rooms(self):
+        S = Game.session(self.G)
+        S.prompt_exe("s")
+        S.gets()
+        self.assertFalse(self.flowers.is_visited)
+        self.G.prompt_exe("s")
+        self.assertTrue(self.flowers.is_visited)
+
+    def test_render_invalidation(self):
+        changes = [lambda: self.G._changeItem("bauble", "ground", "Shiny!"),
+                   lambda: self.G.prompt_exe("take bauble"),
+                   lambda: self.G._changeRoom("initial", "entry_desc",
+                                              ("Somewhere else.",)),
+                   lambda: self.G.prompt_exe("undo")]
+        for n, change in enumerate(changes):
+            with self.subTest(change=n):
+                before = self.G.gets()
+                change()
+                self.assertNotEqual(self.G.gets(), before)
+
+    def test_look(self):
+        self.G.prompt_exe("look")
+        self.assertNotIn(Game.ERROR["exe_pass"], self.G.gets())
+
+class Game_Output_Tester(Game_Tester):
+    def test_stream_matches_gets(self):
+        H = Game(*self.Reader.output())
+        for G in (self.G, H):
+            G.prompt_exe("take bauble")
+            G.prompt_exe("i")
+        self.assertEqual(''.join(self.G.stream()), H.gets())
+        self.assertFalse(self.G.output)
+
+    def test_stream_is_incremental(self):
+        self.G._puts("one")
+        chunks = self.G.stream()
+        self.assertEqual(next(chunks), self.G.static_output)
+        next(chunks)
+        self.assertEqual(next(chunks), "one")
+        self.G._puts("two")
+        self.assertEqual(list(chunks), ["\n", "two", "\n"])
+
+    def test_inventory_listing(self):
+        self.assertEqual(str(self.G.inventory), "You are not holding anything.")
+        self.G.prompt_exe("take bauble")
+        self.assertEqual(str(self.G.inventory),
+                         "You are holding:\n\tblue bauble\n")
+        self.G.prompt_exe("i")
+        self.assertIn(str(self.G.inventory), self.G.gets())
+
 class Game_ActionSystem_Tester(Game_Tester):
     @mock.patch('builtins.print', autospec=True)
     def test_nonaction(self, mock_print):
@@ -161,6 +602,27 @@ class Game_ActionSystem_Tester(Game_Tester):
         self.G._act("tap florgisborg".split())
         mock__puts.assert_called_with(Game.ERROR["item_not_found"])
 
+    def test_bpCompile_resolves_arguments(self):
+        op, args = self.G._bpCompile("link!entrance-N->house")
+        self.assertIs(op, Game._link)
+        self.assertEqual(args, (self.entrance, "N", self.house))
+        self.assertIsNone(self.G._bpCompile("pass"))
+
+    def test_compiled_actions(self):
+        unlock = self.G.actions["unlock"]
+        program = unlock.call([self.door, self.key], compiled = True)
+        self.assertEqual([op for op, args in program],
+                         [Game._link, Game._puts,
+                          Game._addProperty, Game._removeProperty])
+
+    def test_userAct_runs_compiled_code(self):
+        self.G.loc = self.entrance
+        self.G._move(self.key, self.entrance, self.G.inventory)
+        self.G._act("unlock door with key".split())
+        self.assertIs(self.entrance.links[2], self.house)
+        self.assertIn("unlocked", self.door.properties)
+        self.assertNotIn("locked", self.door.properties)
+
     def test_unaryTester(self):
         prop_dict = {
                         "p:wooden"  :[False,False,True],
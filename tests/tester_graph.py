@@ -0,0 +1,145 @@
+""" tester_graph:
+        Tests room exits, the room graph index and travelling with them. """
+
+import unittest
+
+from architect.graph import RoomGraph
+from architect.ontology import Room
+from tests.tester_game_module import Game_Tester
+
+class RoomGraph_Tester(unittest.TestCase):
+    def setUp(self):
+        # a <-> b -> c, and d on its own.
+        self.G = RoomGraph([("a", [None, "b", None, None]),
+                            ("b", [None, None, "a", "c"]),
+                            ("c", {}), ("d", {})])
+
+    def test_path(self):
+        self.assertEqual(self.G.path("a", "c"), [(1, "b"), (3, "c")])
+        self.assertEqual(self.G.path("a", "a"), [])
+        self.assertIsNone(self.G.path("c", "a"))
+
+    def test_distances(self):
+        self.assertEqual(self.G.distances("a"), {"a": 0, "b": 1, "c": 2})
+        self.assertEqual(self.G.within("a", 1), ["a", "b"])
+        self.assertEqual(self.G.distances(["c", "b"]),
+                         {"c": 0, "b": 0, "a": 1})
+        self.assertEqual(self.G.unreachable("a"), ["d"])
+
+    def test_link(self):
+        self.G.link("c", "up", "d")
+        self.assertEqual(self.G.reachable("a"), {"a", "b", "c", "d"})
+        self.G.link("b", 3, None)
+        self.assertEqual(self.G.reachable("a"), {"a", "b"})
+
+    def test_search(self):
+        self.assertEqual(self.G.search("a", lambda x: x in "cd"),
+                         [(1, "b"), (3, "c")])
+        self.assertEqual(self.G.search("b", lambda x: x != "c"), [])
+        self.assertIsNone(self.G.search("a", lambda x: x == "d"))
+
+    def test_find(self):
+        G = RoomGraph([("Attic", {})])
+        self.assertEqual(G.find("attic"), "Attic")
+        self.assertIsNone(G.find("cellar"))
+
+    def test_components(self):
+        self.assertEqual(sorted(map(sorted, self.G.components())),
+                         [["a", "b", "c"], ["d"]])
+
+class Game_Graph_Tester(Game_Tester):
+    def test_go_to(self):
+        self.G.prompt_exe("go to a flowery meadow")
+        self.assertIs(self.G.loc, self.G.rooms["flowers"])
+        self.G.prompt_exe("go to initial")
+        self.assertIs(self.G.loc, self.initial)
+        self.G.prompt_exe("undo")
+        self.assertIs(self.G.loc, self.G.rooms["flowers"])
+
+    def test_go_to_walks(self):
+        self.G._link("entrance", "n", "house")
+        before = len(self.G.journal)
+        self.G.prompt_exe("go to basement")
+        self.assertIs(self.G.loc, self.G.rooms["basement"])
+        step = self.G.journal[-1]
+        self.assertEqual(len(self.G.journal), before + 1)
+        self.assertEqual([args for op, args in step],
+                         [("initial",), ("entrance",), ("house",)])
+        self.G.prompt_exe("undo")
+        self.assertIs(self.G.loc, self.initial)
+
+    def test_go_to_mixed_case_id(self):
+        rooms, items, actions, meta = self.Reader.output()
+        rooms = dict(rooms, Attic={"id": "Attic", "name": "Dusty Attic"})
+        rooms["initial"] = dict(rooms["initial"], exits={"up": "Attic"})
+        G = type(self.G)(rooms, items, actions, meta)
+        G.prompt_exe("go to Attic")
+        self.assertEqual(G.loc.id, "Attic")
+
+    def test_go_to_unreachable(self):
+        self.G.prompt_exe("go to the basement")
+        self.assertIs(self.G.loc, self.initial)
+        self.assertIn(self.G.ERROR["go_unknown"], self.G.gets())
+
+    def test_links_update_graph(self):
+        self.assertIsNone(self.G.graph.path("initial", "basement"))
+        self.G._link("entrance", "n", "house")
+        self.assertEqual(len(self.G.graph.path("initial", "basement")), 3)
+        self.G.rollback()
+        self.assertIsNone(self.G.graph.path("initial", "basement"))
+
+    def test_session_graph(self):
+        S = type(self.G).session(self.G)
+        self.assertIs(S.graph, self.G.graph)
+        S._link("entrance", "n", "house")
+        self.assertIsNot(S.graph, self.G.graph)
+        self.assertIsNone(self.G.graph.path("initial", "house"))
+        self.assertIsNotNone(S.graph.path("initial", "house"))
+
+class Room_Exits_Tester(unittest.TestCase):
+    def setUp(self):
+        self.a, self.b = Room({"id": "a"}), Room({"id": "b"})
+
+    def test_link(self):
+        self.a.link(self.b, "up")
+        self.assertIs(self.b.exit("down"), self.a)
+        self.a.link(self.b, 2)
+        self.assertIs(self.b.exit(1), self.a)
+        self.a.link(self.b, "portal")
+        self.assertIs(self.a.exit("portal"), self.b)
+        self.assertIsNone(self.b.exit("portal"))
+        self.assertEqual(list(self.a.allExits()),
+                         [(2, self.b), ("up", self.b), ("portal", self.b)])
+
+class Game_Exits_Tester(Game_Tester):
+    def test_up_and_down(self):
+        self.G._link("initial", "up", "house")
+        self.assertIs(self.initial.exits["up"], self.house)
+        self.assertIs(self.house.exits["down"], self.initial)
+        self.G.prompt_exe("u")
+        self.assertIs(self.G.loc, self.house)
+        self.G.prompt_exe("go down")
+        self.assertIs(self.G.loc, self.initial)
+        self.assertIsNotNone(self.G.graph.path("initial", "basement"))
+
+    def test_named_exit(self):
+        self.G._link("initial", "portal", "basement")
+        self.assertIsNone(self.G.rooms["basement"].exits)
+        self.G.prompt_exe("portal")
+        self.assertEqual(self.G.loc.id, "basement")
+        self.G.prompt_exe("go portal")
+        self.assertIn("I can't go that way.", self.G.gets())
+
+    def test_undo_and_restore(self):
+        saved = self.G.snapshot()
+        self.G._link("initial", "in", "house")
+        self.G.rollback()
+        self.assertFalse(self.initial.exits)
+        self.assertFalse(self.house.exits)
+        self.G._link("initial", "in", "house")
+        self.G.restore(saved)
+        self.assertFalse(self.initial.exits)
+        self.assertIsNone(self.G.graph.path("initial", "house"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+""" tester_instrument:
+        Tests stage timing of Game commands. """
+
+import unittest, mock
+
+from architect.game import Game
+from architect.instrument import Instruments, Histogram
+from architect.utils import JSON_Reader
+
+class Histogram_Tester(unittest.TestCase):
+    def test_percentiles(self):
+        H = Histogram()
+        for x in [1e-6] * 99 + [1e-3]:
+            H.add(x)
+        self.assertEqual(H.count, 100)
+        self.assertLessEqual(H.percentile(0.5), 2e-6)
+        self.assertGreaterEqual(H.percentile(0.5), 1e-6)
+        self.assertEqual(H.percentile(1), 1e-3)
+        self.assertEqual(H.stats()["max_us"], 1000)
+
+class Instruments_Tester(unittest.TestCase):
+    def setUp(self):
+        self.G = Game(*JSON_Reader().output())
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(self.G.instruments)
+        self.G.prompt_exe("tap bauble")
+
+    def test_stages(self):
+        I = self.G.instrument()
+        self.G.prompt_exe("tap bauble")
+        self.G.prompt_exe("take bauble")
+        self.G.gets()
+        H = I.stats()["histograms"]
+        for stage in ["command", "tokenize", "actionParse", "itemNametoItem",
+                      "call", "dispatch.puts", "gets", "room_update"]:
+            with self.subTest(stage=stage):
+                self.assertIn(stage, H)
+        self.assertEqual(H["command"]["count"], 2)
+        self.assertEqual(I.stats()["counters"], {"commands": 2})
+
+    def test_callback(self):
+        seen = []
+        self.G.instrument(Instruments(lambda *x: seen.append(x[0])))
+        self.G.prompt_exe("n")
+        self.assertEqual(seen, ["tokenize", "command"])
+
+    def test_bpParse_at_load(self):
+        I = Instruments()
+        with mock.patch.object(Game, "instruments", I):
+            Game(*JSON_Reader().output())
+        self.assertGreater(I.histograms["bpParse"].count, 0)
+
+if __name__ == "__main__":
+    unittest.main()
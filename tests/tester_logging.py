@@ -0,0 +1,50 @@
+""" tester_logging:
+        Tests Game's debugging logs and the queued log handler. """
+
+import logging
+import unittest
+
+from architect.game import Game
+from architect.utils import JSON_Reader, Log_Queue
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+class Logging_Tester(unittest.TestCase):
+    def setUp(self):
+        self.G = Game(*JSON_Reader().output())
+        self.H = Game(*JSON_Reader().output())
+        self.records = Records()
+        logging.getLogger("architect").addHandler(self.records)
+
+    def tearDown(self):
+        logging.getLogger("architect").removeHandler(self.records)
+
+    def test_quiet_by_default(self):
+        self.G.prompt_exe("tap bauble")
+        self.assertEqual(self.records.records, [])
+
+    def test_trace_one_game(self):
+        self.G.trace(name="traced")
+        self.G.prompt_exe("tap bauble")
+        self.H.prompt_exe("tap bauble")
+        names = {x.name for x in self.records.records}
+        self.assertEqual(names, {"architect.game.traced"})
+        messages = [x.getMessage() for x in self.records.records]
+        self.assertIn("Treating tap as an action.", messages)
+
+    def test_log_queue(self):
+        Q = Records()
+        with Log_Queue(Q):
+            self.G.trace(name="queued")
+            self.G.prompt_exe("tap bauble")
+        self.assertTrue(Q.records)
+        self.assertEqual(len(Q.records), len(self.records.records))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,8 +7,10 @@ import mock
 from collections import OrderedDict
 
 from architect.utils import JSON_Reader, Parser
-from architect.ontology import Room, Item, Inventory, Action
+from architect.ontology import Room, Item, Inventory, Action, Holding
+from architect.ontology import Condition, Clause
 
+from architect.game import Game
 from tests.tester_game_module import Game_Loader, Game_Tester
 
 testing_JR = True
@@ -94,6 +96,27 @@ class JR_Tester(Game_Loader):
                     else:
                         self.assertEqual(grabObjVar(i_var), 'item')
                         
+class JR_Streaming_Tester(Game_Loader):
+    def test_stream_matches_load(self):
+        records = list(self.Reader.stream(chunk_size = 7))
+        self.assertEqual(len(records),
+                         sum(len(x) for x in self.Reader.output()))
+        for x in records:
+            with self.subTest(id = x["id"]):
+                info = getattr(self.Reader, x["type"]+"_info")
+                self.assertEqual(info[x["id"]], x)
+
+    def test_streaming_builds_objects(self):
+        F = JSON_Reader(streaming = True)
+        self.assertIsInstance(F.room_info["initial"], Room)
+        self.assertIsInstance(F.item_info["bauble"], Item)
+        self.assertIsInstance(F.action_info["unlock"], Action)
+        self.assertIn("seconds", F.stats)
+
+        G = Game(*F.output())
+        self.assertIs(G.rooms["initial"], F.room_info["initial"])
+        self.assertIn(G.items["bauble"], G.rooms["initial"])
+
 class Item_Tester(Game_Loader):
     @unittest.skipUnless(testing_items, "not testing this")
     def setUp(self):
@@ -151,6 +174,35 @@ class Room_Tester(Game_Loader):
     def test_Room_link(self):
         self.field.link(self.initial, 0)
         self.assertEqual(self.field.links[0], self.initial)
+
+class Holding_Tester(unittest.TestCase):
+    def setUp(self):
+        self.H = Holding("abc")
+
+    def test_order_and_counts(self):
+        self.H.append("b")
+        self.assertEqual(list(self.H), ["a", "b", "b", "c"])
+        self.assertEqual((len(self.H), self.H.count("b")), (4, 2))
+        self.H.remove("b")
+        self.assertEqual(self.H, ["a", "b", "c"])
+        self.assertIn("b", self.H)
+
+    def test_remove_missing(self):
+        self.assertRaises(ValueError, self.H.remove, "z")
+
+    def test_insert_restores_place(self):
+        key = self.H.position("b")
+        self.H.remove("b")
+        self.H.append("d")
+        self.H.insert(key, "b")
+        self.assertEqual(self.H, ["a", "b", "c", "d"])
+        self.assertEqual(self.H.position("b"), key)
+
+    def test_room_wraps_lists(self):
+        R = Room({"id": "r", "hold": "x"})
+        self.assertIsInstance(R.holding, Holding)
+        self.assertEqual(R.holding, ["x"])
+        self.assertEqual(R.holding + ["y"], ["x", "y"])
         
 class Action_Tester(Game_Loader):
     @unittest.skipUnless(testing_actions, "not testing this")
@@ -204,6 +256,91 @@ class Action_Tester(Game_Loader):
                         for __ in _: self.assertIsInstance(__, str)
                     self.assertIsInstance(value, list)
 
+class Action_Condition_Tester(Game_Tester):
+    def test_Condition_parsing(self):
+        C = Condition("~p:locked")
+        self.assertTrue(C.negated)
+        self.assertEqual(C.property, "locked")
+        self.assertIsNone(C.id)
+        self.assertFalse(C.test(self.door))
+        self.assertTrue(C.test(self.key))
+
+    def test_Clause_masks(self):
+        C = Clause(Condition(x) for x in ["p:wooden", "~p:unlocked", "p:door"])
+        self.assertEqual(C.required, Item.registry.mask(["wooden", "door"]))
+        self.assertEqual(C.forbidden, Item.registry.bit("unlocked"))
+        self.assertTrue(C.test(self.door))
+        self.door.setProperty("unlocked")
+        self.assertFalse(C.test(self.door))
+
+    def test_Clause_impossible(self):
+        self.assertTrue(Clause([Condition("bauble"),
+                                Condition("worn_key")]).impossible)
+        self.assertTrue(Clause([Condition("p:glass"),
+                                Condition("~p:glass")]).impossible)
+        self.assertFalse(Clause([Condition("")]).impossible)
+
+    def test_Room_withProperty(self):
+        self.G._add("shards", "initial")
+        self.assertEqual(self.initial.withProperty("glass"),
+                         [self.bauble, self.G.items["shards"]])
+        self.assertEqual(self.initial.withProperty("static"),
+                         [self.G.items["shards"]])
+
+    def test_Item_isProp_follows_mask(self):
+        self.assertFalse(self.bauble.isProp)
+        self.G._addProperty("bauble", "static")
+        self.assertTrue(self.bauble.isProp)
+
+    def big_action(self):
+        """ An action with enough branches to be indexed. """
+        one = OrderedDict(("p:filler%d" % n, "puts!%d" % n)
+                          for n in range(Action.INDEX_THRESHOLD))
+        one["~p:glass&p:metal"] = "puts!metal"
+        one["bauble"] = "puts!bauble"
+        one["p:wooden"] = "puts!wooden"
+        one[""] = "puts!other"
+        return Action({"id": "poke", "one": one})
+
+    def test_Action_indexed_call(self):
+        poke = self.big_action()
+        self.assertIsNotNone(poke.unary_index)
+        self.assertEqual(poke.call([self.bauble]), ["puts!bauble"])
+        self.assertEqual(poke.call([self.key]), ["puts!metal"])
+        self.assertEqual(poke.call([self.door]), ["puts!wooden"])
+        self.assertEqual(poke.call([self.G.items["notebook"]]),
+                         ["puts!other"])
+
+    def test_Action_indexed_call_keeps_order(self):
+        poke = self.big_action()
+        self.bauble.setProperty("filler3")
+        self.assertEqual(poke.call([self.bauble]), ["puts!3"])
+
+class Compact_Representation_Tester(Game_Tester):
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(self.bauble, "__dict__"))
+        self.assertFalse(hasattr(self.initial, "__dict__"))
+
+    def test_shared_property_sets(self):
+        twin = Item({"id": "twin", "name": "twin door",
+                     "property": ["static", "locked", "wooden", "door"]})
+        self.assertIs(twin.properties, self.door.properties)
+
+        twin.setProperty("unlocked")
+        self.assertIn("unlocked", twin.properties)
+        self.assertNotIn("unlocked", self.door.properties)
+
+    def test_testing_unknown_properties(self):
+        bits = len(Item.registry.bits)
+        self.assertFalse(self.bauble.hasProperty("never-set"))
+        self.assertEqual(self.initial.withProperty("never-set"), [])
+        self.assertTrue(self.bauble.setProperty("never-set", False))
+        self.assertEqual(len(Item.registry.bits), bits)
+
+    def test_unknown_attribute(self):
+        with self.assertRaises(AttributeError):
+            self.G._changeItem("bauble", "colour", "red")
+
 class Ontology_InventoryTester(Game_Tester):
     def setUp(self):
         super().setUp()
@@ -227,4 +364,32 @@ class Ontology_InventoryTester(Game_Tester):
         self.inv.add(self.bauble)
         self.assertEqual([self.key, self.bauble], list(self.inv))
 
+    def test_find_and_remove(self):
+        self.assertEqual(self.inv.find(self.key), "main")
+        self.assertIsNone(self.inv.find(self.door))
+        self.inv.remove(self.key, None)
+        self.assertNotIn(self.key, self.inv)
+        self.assertFalse(self.inv)
+        self.assertEqual(self.inv.names.get("key"), ())
+
+    def test_bags(self):
+        self.inv.holding["pocket"] = [self.bauble]
+        self.assertEqual(self.inv.find(self.bauble), "pocket")
+        self.inv.holding["main"].add(self.bauble)
+        self.assertEqual(self.inv.find(self.bauble), "main")
+        self.assertNotIn(self.bauble, self.inv.holding["pocket"])
+        self.assertEqual(len(self.inv), 2)
+
+    def test_capacities(self):
+        self.key.weight, self.bauble.weight = 3, "2"
+        I = Inventory(OrderedDict([("small", [self.key]), ("big", [])]),
+                      {"small": 4, "big": -1})
+        self.assertEqual(I.weight("small"), 3)
+        self.assertEqual(I.add(self.bauble, "small"), -1)
+        self.assertEqual(I.add(self.bauble), 0)
+        self.assertEqual(I.find(self.bauble), "big")
+        self.assertEqual(I.weight(), 5)
+        I.remove(self.key, "small")
+        self.assertEqual(I.weight("small"), 0)
+
 if __name__ == '__main__': unittest.main()
@@ -1,7 +1,7 @@
 import unittest
 
 from architect.game import Game
-from architect.utils import Parser
+from architect.utils import Parser, PhraseIndex
 from architect.ontology import Item, Room, Inventory, Action
 
 from tests.tester_game_module import Game_Tester
@@ -94,6 +94,51 @@ class Action_Parser_Tester(Parser_Tester):
     def test_Action_actionParse_2_successfully(self):
         self.assertEqual(self.parser.actionParse(self.unlock, "door with key"), 
                                                  ["door", "key"])
+
+    def test_Action_actionParse_grammar_cached(self):
+        self.parser.actionParse(self.tap, "bauble")
+        grammar = self.parser._itemGrammar()
+        self.parser.actionParse(self.tap, "key")
+        self.assertIs(self.parser._itemGrammar(), grammar)
+        self.assertEqual(self.unlock.prep_words, ["with"])
+
+    def test_Action_actionParse_vocabChanged(self):
+        self.parser.actionParse(self.tap, "bauble")
+        self.G.items["bauble"].nickname = "marble"
+        self.parser.vocabChanged()
+        self.assertEqual(self.parser.actionParse(self.tap, "marble"),
+                         ["marble"])
+
+    def test_Game_changeItem_invalidates_grammar(self):
+        self.G.parser.actionParse(self.tap, "bauble")
+        self.G._changeItem("bauble", "nick", "marble")
+        self.assertEqual(self.G.items["bauble"].nickname, "marble")
+        self.assertEqual(self.G.parser.actionParse(self.tap, "marble"),
+                         ["marble"])
+
+    def test_Action_actionParse_longest_name(self):
+        self.assertEqual(self.parser.actionParse(self.tap, "Blue  bauble"),
+                         ["blue bauble"])
+        self.assertEqual(self.parser.actionParse(self.unlock,
+                                                 "the door with a worn key"),
+                         ["door", "worn key"])
+
+    def test_Action_actionParse_unknown_name(self):
+        self.assertEqual(self.parser.actionParse(self.tap, "grue"),
+                         "$! Input < Min")
+
+class PhraseIndex_Tester(unittest.TestCase):
+    def test_match(self):
+        I = PhraseIndex(["key", "worn key", "worn key ring", None])
+        words = "the worn key ring".split()
+        self.assertEqual(I.match(words, 1), (4, "worn key ring"))
+        self.assertEqual(I.match(words[:3], 1), (3, "worn key"))
+        self.assertEqual(I.match(words, 0), (None, None))
+        self.assertEqual(I.match(["worn"], 0), (None, None))
+
+    def test_punctuated_names(self):
+        I = PhraseIndex(["Orb,  Small"])
+        self.assertEqual(I.match(["orb", "small"]), (2, "orb, small"))
   
 
 
@@ -0,0 +1,52 @@
+""" tester_replay:
+        Tests replaying transcripts over a process pool. """
+
+import os
+import tempfile
+import unittest
+import mock
+
+from architect import replay
+from architect.game import Game
+from architect.replay import replayMany
+
+class Replay_Tester(unittest.TestCase):
+    def setUp(self):
+        F = tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False)
+        F.write("take bauble\n\nn\n")
+        F.close()
+        self.transcript = F.name
+
+    def tearDown(self):
+        os.remove(self.transcript)
+
+    def test_replay_many(self):
+        report = replayMany([self.transcript] * 5, processes=2)
+        self.assertEqual(report["transcripts"], 5)
+        self.assertEqual(report["commands"], 10)
+        self.assertGreater(report["commands_per_second"], 0)
+        self.assertNotIn("errors", report)
+
+    def test_outputs_and_errors(self):
+        report = replayMany([self.transcript, ["take bauble", "tap"]],
+                            processes=1, keep_output=True)
+        first, second = report["outputs"]
+        self.assertEqual(len(first), 3)
+        self.assertIn("Picked up the blue bauble.", first[1])
+        # Each transcript gets a fresh session.
+        self.assertIn("Picked up the blue bauble.", second[1])
+        self.assertEqual(report["commands"], 4)
+
+    def test_missing_world(self):
+        with self.assertRaises(FileNotFoundError):
+            replayMany([["look"]], world="/nonexistent.json", processes=1)
+
+    def test_error_counts_its_command(self):
+        replay._startWorker(replay.DEFAULT_WORLD)
+        with mock.patch.object(Game, '_inv', side_effect=RuntimeError):
+            count, _, _, error = replay._play((["n", "i", "s"], False))
+        self.assertEqual(count, 2)
+        self.assertIn("RuntimeError", error)
+
+if __name__ == "__main__":
+    unittest.main()
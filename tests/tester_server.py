@@ -0,0 +1,70 @@
+""" tester_server:
+        Tests Game_Server sessions over a local TCP connection. """
+
+import asyncio
+import json
+import mock
+import unittest
+
+from architect.game import Game
+from architect.server import Game_Server, Session, PROMPT, FAILED
+
+class Server_Tester(unittest.TestCase):
+    def setUp(self):
+        self.server = Game_Server()
+
+    def test_sessions_are_independent(self):
+        A = Session(1, self.server.newGame())
+        B = Session(2, self.server.newGame())
+        A.start(), B.start()
+        A.execute("take bauble")
+        self.assertIn(A.game.items["bauble"], A.game.inventory)
+        self.assertNotIn(B.game.items["bauble"], B.game.inventory)
+        self.assertIn(B.game.items["bauble"], B.game.loc)
+        self.assertEqual(A.stats()["commands"], 1)
+        self.assertEqual(B.stats(), {"commands": 0})
+
+    def test_failed_command_is_undone(self):
+        S = Session(1, self.server.newGame())
+        S.start()
+        S.execute("take bauble")
+        def fail(*args):
+            S.game._move(S.game.items["bauble"], '_', S.game.loc)
+            raise ValueError
+        with mock.patch.object(Game, '_inv', side_effect=fail), \
+                self.assertLogs("architect.server", "ERROR"):
+            self.assertEqual(S.execute("i"), FAILED)
+        self.assertIn(S.game.items["bauble"], S.game.inventory)
+        self.assertEqual(len(S.game.journal), 1)
+        S.execute("undo")
+        self.assertNotIn(S.game.items["bauble"], S.game.inventory)
+
+    def test_line_protocol(self):
+        async def read_reply(reader):
+            return (await reader.readuntil(PROMPT.encode())).decode()
+
+        async def client(port, commands):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            replies = [await read_reply(reader)]
+            for x in commands:
+                writer.write((x + "\n").encode())
+                replies.append(await read_reply(reader))
+            writer.close()
+            return replies
+
+        async def run():
+            server = await self.server.start()
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                return await asyncio.gather(
+                        client(port, ["take bauble", "#stats"]),
+                        client(port, ["n", "take key"]))
+
+        first, second = asyncio.run(run())
+        self.assertIn("Welcome to the demo!", first[0])
+        self.assertIn("Picked up the blue bauble.", first[1])
+        stats = json.loads(first[2][:-len(PROMPT)])
+        self.assertEqual(stats["commands"], 1)
+        self.assertIn("Picked up the worn key.", second[2])
+
+if __name__ == '__main__': unittest.main()
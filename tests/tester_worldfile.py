@@ -0,0 +1,63 @@
+""" tester_worldfile:
+        Tests compiling JSON worlds into world files and reading them back
+        through World_Reader. """
+
+import os
+import tempfile
+import unittest
+
+from architect.game import Game
+from architect.ontology import Room
+from architect.worldfile import World_Writer, World_Reader, pack, unpack
+
+from tests.tester_game_module import Game_Loader
+
+class WorldFile_Tester(Game_Loader):
+    def setUp(self):
+        super().setUp()
+        handle, self.path = tempfile.mkstemp(suffix = ".arcw")
+        os.close(handle)
+        World_Writer.compile(self.Reader.f, self.path)
+        self.W = World_Reader(self.path)
+
+    def tearDown(self):
+        self.W.close()
+        os.remove(self.path)
+
+    def test_records_roundtrip(self):
+        for json_info, view in zip(self.Reader.output(), self.W.output()):
+            with self.subTest(view = view):
+                self.assertEqual(sorted(view), sorted(json_info))
+                for iden, record in json_info.items():
+                    self.assertEqual(view[iden], record)
+
+    def test_missing_record(self):
+        with self.assertRaises(KeyError):
+            self.W.view("room")["moon"]
+        self.assertNotIn("moon", self.W.view("room"))
+        self.assertIn("initial", self.W.view("room"))
+
+    def test_bad_magic(self):
+        with self.assertRaises(ValueError):
+            World_Reader(self.Reader.f)
+
+    def test_game_from_world_file(self):
+        G = Game(*self.W.output())
+        self.assertIsInstance(G.rooms["initial"], Room)
+        self.assertIn(G.items["bauble"], G.rooms["initial"])
+
+    def test_lazy_game_from_world_file(self):
+        self.W.meta_info['isLazy'] = True
+        G = Game(*self.W.output())
+        self.assertTrue(G.is_lazy)
+        G.prompt_exe("n")
+        self.assertIs(G.loc, G.rooms["entrance"])
+
+class Pack_Tester(unittest.TestCase):
+    value = {"id": "x", "n": [1, -2.5, None, True, False, "é"], "d": {}}
+
+    def test_roundtrip(self):
+        blob = pack(self.value)
+        self.assertEqual(unpack(blob), (self.value, len(blob)))
+
+if __name__ == '__main__': unittest.main()